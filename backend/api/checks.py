@@ -0,0 +1,19 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def check_pdf_font(app_configs, **kwargs):
+    """Без шрифта с кириллицей список покупок в PDF не собрать."""
+    if os.path.exists(settings.PDF_FONT_PATH):
+        return []
+    return [
+        Warning(
+            f'Нет файла шрифта PDF_FONT_PATH: {settings.PDF_FONT_PATH}.',
+            hint='Укажите в PDF_FONT_PATH TTF-шрифт с кириллицей, '
+                 'например DejaVuSans.ttf.',
+            id='api.W001',
+        )
+    ]
@@ -1,7 +1,63 @@
-from django_filters import ModelMultipleChoiceFilter
+from django.core.exceptions import ValidationError
+from django.db.models import Exists, OuterRef
+from django.forms import MultipleChoiceField
+from django_filters import ChoiceFilter, Filter
 from django_filters.rest_framework import BooleanFilter, CharFilter, FilterSet
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.indexes import get_tag_index
+from api.serializers import get_user_recipe_ids
+from config import RECIPE_ORDERINGS, TAG_INDEX_MAX_AGE
+from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
+
+RecipeTag = Recipe.tags.through
+
+
+class TagSlugsField(MultipleChoiceField):
+    """
+    Слаги тегов, проверенные по словарю тегов процесса.
+
+    Версию тегов словарь сверяет не чаще раза в TAG_INDEX_MAX_AGE
+    секунд, так что страница с фильтром не тратит на неё запрос. Слаг,
+    которого нет в словаре, перепроверяется по свежей версии: новый тег
+    не отклоняется. Фильтр идёт по слагам, а не по id из словаря,
+    поэтому устаревший словарь не меняет выдачу.
+    """
+
+    def clean(self, value):
+        slugs = self.to_python(value)
+        if not slugs:
+            return []
+        _, missing = get_tag_index(TAG_INDEX_MAX_AGE).get_ids(slugs)
+        if missing:
+            _, missing = get_tag_index().get_ids(slugs)
+        if missing:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': missing[0]},
+            )
+        return slugs
+
+
+class TagSlugsFilter(Filter):
+    """
+    Рецепты хотя бы с одним из тегов.
+
+    Условие - коррелированный EXISTS по таблице связей: теги не
+    присоединяются к основному запросу, поэтому рецепты не дублируются
+    и DISTINCT не нужен.
+    """
+
+    field_class = TagSlugsField
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        return qs.filter(Exists(RecipeTag.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag__slug__in=value,
+        )))
 
 
 class IngredientSetFilter(FilterSet):
@@ -18,29 +74,44 @@ class IngredientSetFilter(FilterSet):
 
 class RecipeSetFilter(FilterSet):
 
-    tags = ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
-        label='tags',
-    )
+    tags = TagSlugsFilter(label='tags')
     is_in_shopping_cart = BooleanFilter(
         method='filter_by_is_in_shopping_cart'
     )
     is_favorited = BooleanFilter(
         method='filter_by_is_favorited'
     )
+    search = CharFilter(
+        method='filter_by_search'
+    )
+    ordering = ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='order_by',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_in_shopping_cart', 'is_favorited')
+        fields = (
+            'author', 'tags', 'is_in_shopping_cart', 'is_favorited', 'search',
+            'ordering',
+        )
 
     def filter_by_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(shoppingcarts__user=self.request.user)
+            return queryset.filter(
+                id__in=get_user_recipe_ids(self.request).shopping_cart
+            )
         return queryset
 
     def filter_by_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(
+                id__in=get_user_recipe_ids(self.request).favorites
+            )
         return queryset
+
+    def filter_by_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def order_by(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
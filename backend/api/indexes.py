@@ -0,0 +1,260 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import namedtuple
+from threading import Lock
+from time import monotonic
+
+from config import (INGREDIENTS_VERSION_KEY, RECIPE_INDEX_MAX_CHANGES,
+                    RECIPES_VERSION_KEY, TAGS_VERSION_KEY)
+from recipes.models import (DataVersion, Ingredient, IngredientRecipe, Recipe,
+                            RecipeChange, Tag)
+
+RecipeTag = Recipe.tags.through
+IndexedRecipe = namedtuple(
+    'IndexedRecipe',
+    ('cache_version', 'cooking_time', 'tags', 'ingredients')
+)
+
+_ingredient_index = None
+_tag_index = None
+_recipe_index = None
+_recipe_index_lock = Lock()
+
+
+class IngredientPrefixIndex:
+    """Отсортированный по названию список ингредиентов для поиска по началу."""
+
+    def __init__(self, version, ingredients):
+        self.version = version
+        self.ingredients = sorted(
+            ingredients,
+            key=lambda ingredient: (
+                ingredient['name'].lower(),
+                ingredient['measurement_unit'],
+            )
+        )
+        self.keys = [
+            ingredient['name'].lower() for ingredient in self.ingredients
+        ]
+
+    def search(self, prefix, limit=None):
+        """
+        Ищет ингредиенты, название которых начинается с prefix.
+
+        Первым идёт точное совпадение, затем более короткие названия.
+        """
+        prefix = prefix.lower()
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + chr(0x10FFFF), lo=start)
+        matches = sorted(
+            range(start, end),
+            key=lambda index: (
+                self.keys[index] != prefix,
+                len(self.keys[index]),
+                index,
+            )
+        )
+        return [self.ingredients[index] for index in matches[:limit]]
+
+
+def get_ingredient_index():
+    """Возвращает индекс процесса, перестраивая его при смене версии."""
+    global _ingredient_index
+    version = DataVersion.get_version(INGREDIENTS_VERSION_KEY)
+    if _ingredient_index is None or _ingredient_index.version != version:
+        _ingredient_index = IngredientPrefixIndex(
+            version,
+            Ingredient.objects.values('id', 'name', 'measurement_unit')
+        )
+    return _ingredient_index
+
+
+class TagSlugIndex:
+    """Словарь слаг -> id тега."""
+
+    def __init__(self, version, tags):
+        self.version = version
+        self.checked_at = monotonic()
+        self.ids = dict(tags)
+
+    def get_ids(self, slugs):
+        """Возвращает id тегов и список слагов, которых нет."""
+        ids = []
+        missing = []
+        for slug in slugs:
+            if slug in self.ids:
+                ids.append(self.ids[slug])
+            else:
+                missing.append(slug)
+        return ids, missing
+
+
+def get_tag_index(max_age=None):
+    """
+    Возвращает словарь тегов процесса, перестраивая его при смене версии.
+
+    С max_age версия проверяется не чаще раза в max_age секунд.
+    """
+    global _tag_index
+    now = monotonic()
+    if (_tag_index is not None and max_age is not None
+            and now - _tag_index.checked_at < max_age):
+        return _tag_index
+    version = DataVersion.get_version(TAGS_VERSION_KEY)
+    if _tag_index is None or _tag_index.version != version:
+        _tag_index = TagSlugIndex(
+            version,
+            Tag.objects.values_list('slug', 'id')
+        )
+    _tag_index.checked_at = now
+    return _tag_index
+
+
+class RecipeIngredientIndex:
+    """
+    Обратный индекс: ингредиент -> отсортированный массив id рецептов.
+
+    При смене версии данных индекс читает журнал RecipeChange после
+    последней прочитанной записи и перечитывает ингредиенты и теги
+    только упомянутых там рецептов; удалённые рецепты убираются из
+    массивов. Если записей больше RECIPE_INDEX_MAX_CHANGES, индекс
+    строится заново.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.last_change_id = None
+        self.postings = {}
+        self.recipes = {}
+
+    def refresh(self, version):
+        changes = []
+        if self.last_change_id is not None:
+            changes = list(RecipeChange.objects.filter(
+                id__gt=self.last_change_id
+            ).order_by('id').values_list(
+                'id',
+                'recipe_id'
+            )[:RECIPE_INDEX_MAX_CHANGES + 1])
+        if (self.last_change_id is None
+                or len(changes) > RECIPE_INDEX_MAX_CHANGES):
+            self.rebuild()
+        elif changes:
+            self.last_change_id = changes[-1][0]
+            self.update({recipe_id for _, recipe_id in changes})
+        self.version = version
+
+    def rebuild(self):
+        # Номер записи читается до рецептов: изменения, зафиксированные
+        # позже, придут со следующими записями журнала.
+        self.last_change_id = RecipeChange.objects.order_by(
+            '-id'
+        ).values_list('id', flat=True).first() or 0
+        self.postings = {}
+        self.recipes = {}
+        self.load(self.get_current(Recipe.objects.all()), None)
+
+    def update(self, recipe_ids):
+        current = self.get_current(Recipe.objects.filter(id__in=recipe_ids))
+        changed = []
+        for recipe_id in recipe_ids:
+            recipe = self.recipes.get(recipe_id)
+            if (recipe is not None and recipe_id in current
+                    and recipe.cache_version == current[recipe_id][0]):
+                continue
+            if recipe is not None:
+                self.remove(recipe_id)
+            if recipe_id in current:
+                changed.append(recipe_id)
+        if changed:
+            self.load(current, changed)
+
+    @staticmethod
+    def get_current(recipes):
+        return {
+            recipe_id: (cache_version, cooking_time)
+            for recipe_id, cache_version, cooking_time
+            in recipes.order_by().values_list(
+                'id', 'cache_version', 'cooking_time'
+            )
+        }
+
+    def load(self, current, recipe_ids):
+        """Читает ингредиенты и теги рецептов (или всех рецептов)."""
+        ingredient_rows = IngredientRecipe.objects.order_by()
+        tag_rows = RecipeTag.objects.order_by()
+        if recipe_ids is not None:
+            ingredient_rows = ingredient_rows.filter(recipe_id__in=recipe_ids)
+            tag_rows = tag_rows.filter(recipe_id__in=recipe_ids)
+        else:
+            recipe_ids = list(current)
+        ingredients = {recipe_id: array('I') for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in ingredient_rows.values_list(
+            'recipe_id', 'ingredient_id'
+        ):
+            ingredients[recipe_id].append(ingredient_id)
+        tags = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, tag_id in tag_rows.values_list('recipe_id', 'tag_id'):
+            tags[recipe_id].append(tag_id)
+        new_postings = {}
+        for recipe_id in recipe_ids:
+            cache_version, cooking_time = current[recipe_id]
+            self.recipes[recipe_id] = IndexedRecipe(
+                cache_version,
+                cooking_time,
+                frozenset(tags[recipe_id]),
+                ingredients[recipe_id],
+            )
+            for ingredient_id in ingredients[recipe_id]:
+                new_postings.setdefault(ingredient_id, []).append(recipe_id)
+        for ingredient_id, recipe_ids in new_postings.items():
+            postings = self.postings.get(ingredient_id)
+            if postings is None:
+                self.postings[ingredient_id] = array('I', sorted(recipe_ids))
+            else:
+                for recipe_id in recipe_ids:
+                    insort(postings, recipe_id)
+
+    def remove(self, recipe_id):
+        for ingredient_id in self.recipes.pop(recipe_id).ingredients:
+            postings = self.postings[ingredient_id]
+            del postings[bisect_left(postings, recipe_id)]
+            if not postings:
+                del self.postings[ingredient_id]
+
+    def find(self, ingredients, tags=None, cooking_time=None):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Возвращает тройки (id, сколько ингредиентов есть, скольких
+        не хватает): сначала рецепты, для которых меньше докупать,
+        затем - где больше совпадений, затем - новые.
+        """
+        matched = {}
+        for ingredient_id in set(ingredients):
+            for recipe_id in self.postings.get(ingredient_id, ()):
+                matched[recipe_id] = matched.get(recipe_id, 0) + 1
+        results = []
+        for recipe_id, count in matched.items():
+            recipe = self.recipes[recipe_id]
+            if cooking_time is not None and recipe.cooking_time > cooking_time:
+                continue
+            if tags and recipe.tags.isdisjoint(tags):
+                continue
+            results.append(
+                (recipe_id, count, len(recipe.ingredients) - count)
+            )
+        results.sort(key=lambda result: (result[2], -result[1], -result[0]))
+        return results
+
+
+def find_recipes_by_ingredients(ingredients, tags=None, cooking_time=None):
+    """Ищет рецепты по индексу процесса, догоняя его до версии данных."""
+    global _recipe_index
+    version = DataVersion.get_version(RECIPES_VERSION_KEY)
+    with _recipe_index_lock:
+        if _recipe_index is None:
+            _recipe_index = RecipeIngredientIndex()
+        if _recipe_index.version != version:
+            _recipe_index.refresh(version)
+        return _recipe_index.find(ingredients, tags, cooking_time)
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from hashlib import md5
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import parse_etags
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from config import RENDERED_RESPONSES_MAX_ENTRIES
+from recipes.models import DataVersion
+
+_rendered_responses = OrderedDict()
+
+
+class VersionedResponseCacheMixin:
+    """
+    Кэширует отрендеренный JSON в памяти процесса и отдаёт сильный ETag.
+
+    Ключ кэша и ETag строятся из версии данных version_key и полного
+    пути запроса, поэтому ответ не нужно рендерить для проверки
+    If-None-Match.
+    """
+
+    version_key = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_versioned_response(
+            request,
+            lambda request: super(VersionedResponseCacheMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_versioned_response(
+            request,
+            lambda request: super(VersionedResponseCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    def get_versioned_response(self, request, build_response):
+        version = DataVersion.get_version(self.version_key)
+        etag = '"{}"'.format(md5(
+            f'{self.version_key}:{version}:{request.get_full_path()}'.encode()
+        ).hexdigest())
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        content = _rendered_responses.get(etag)
+        if content is None:
+            response = build_response(request)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = JSONRenderer().render(response.data)
+            _rendered_responses[etag] = content
+            if len(_rendered_responses) > RENDERED_RESPONSES_MAX_ENTRIES:
+                _rendered_responses.popitem(last=False)
+        else:
+            _rendered_responses.move_to_end(etag)
+        response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
@@ -1,6 +1,231 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import partial
+from hashlib import md5
 
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
-class PageLimitPagination(PageNumberPagination):
+from config import (CURSOR_QUERY_PARAM, MAX_PAGE_SIZE, PAGE_COUNT_CACHE_KEY,
+                    PAGE_COUNT_CACHE_TIMEOUT)
+from recipes.models import DataVersion, Recipe
 
+
+def get_keyset_filter(ordering, after):
+    """
+    Условие "строка после after" для сортировки ordering.
+
+    (a, b, c) после (x, y, z): a за x, или a = x и b за y, или
+    a = x, b = y и c за z. Первое поле дополнительно ограничено
+    нестрого, чтобы запрос шёл по индексу сортировки.
+    """
+    if after is None:
+        return Q()
+    lookups = [
+        (field.lstrip('-'), 'lt' if field.startswith('-') else 'gt')
+        for field in ordering
+    ]
+    condition = Q()
+    equal = {}
+    for (name, lookup), value in zip(lookups, after):
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    name, lookup = lookups[0]
+    return Q(**{f'{name}__{lookup}e': after[0]}) & condition
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, кэширующий COUNT(*) под ключом count_key."""
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return super().count
+        count = cache.get(self.count_key)
+        if count is None:
+            count = super().count
+            cache.set(self.count_key, count, PAGE_COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class LimitCursorPagination(CursorPagination):
+
+    cursor_query_param = CURSOR_QUERY_PARAM
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+
+
+class PageNumberLimitPagination(PageNumberPagination):
+
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class PageLimitPagination(PageNumberLimitPagination):
+    """
+    Постраничная пагинация с переключением на курсорную.
+
+    Курсорный режим включается параметром ?cursor= (для первой страницы -
+    пустым) и упорядочивает выдачу по cursor_ordering вьюсета. Позиция
+    CursorPagination - только первое поле сортировки, совпадающие
+    значения она пропускает смещением и на меняющихся данных теряет
+    или повторяет строки. Поэтому сортировка из нескольких полей
+    листается RecipeKeysetPagination по всему ключу.
+    """
+
+    django_paginator_class = CachedCountPaginator
+    cursor_paginator = None
+
+    def get_count_key(self, request, view):
+        """
+        Ключ кэша COUNT(*): действие вьюсета, параметры фильтров и версии
+        данных из get_count_version_keys() вьюсета.
+
+        Пользователя в ключе нет, поэтому число в кэше общее для всех, кто
+        запрашивает выдачу с теми же фильтрами. Без get_count_version_keys
+        число не кэшируется.
+        """
+        get_version_keys = getattr(view, 'get_count_version_keys', None)
+        if get_version_keys is None:
+            return None
+        version_keys = sorted(set(get_version_keys()))
+        versions = dict(DataVersion.objects.filter(
+            key__in=version_keys
+        ).values_list('key', 'version'))
+        params = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+            if name not in (self.page_query_param, self.page_size_query_param)
+        )
+        return PAGE_COUNT_CACHE_KEY.format(md5(repr((
+            type(view).__name__,
+            getattr(view, 'action', None),
+            params,
+            [(key, versions.get(key, 0)) for key in version_keys],
+        )).encode()).hexdigest())
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if CURSOR_QUERY_PARAM not in request.query_params:
+            self.django_paginator_class = partial(
+                CachedCountPaginator,
+                count_key=self.get_count_key(request, view)
+            )
+            return super().paginate_queryset(queryset, request, view)
+        ordering = getattr(
+            view,
+            'cursor_ordering',
+            LimitCursorPagination.ordering
+        )
+        if len(ordering) > 1:
+            self.cursor_paginator = RecipeKeysetPagination()
+            self.cursor_paginator.ordering = ordering
+            self.cursor_paginator.model = queryset.model
+            return self.cursor_paginator.paginate_queryset(
+                lambda after, limit: queryset.filter(
+                    get_keyset_filter(ordering, after)
+                ).order_by(*ordering)[:limit],
+                request,
+                view
+            )
+        self.cursor_paginator = LimitCursorPagination()
+        self.cursor_paginator.ordering = ordering
+        return self.cursor_paginator.paginate_queryset(
+            queryset,
+            request,
+            view
+        )
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipeKeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по ключу сортировки последнего рецепта страницы.
+
+    Ключ - значения полей ordering, по умолчанию (pub_date, id).
+    paginate_queryset получает функцию get_page(after, limit), которая
+    возвращает рецепты после курсора в порядке ordering, так что курсор
+    можно применить внутри запроса, а не поверх него.
+    """
+
+    model = Recipe
+    ordering = ('-pub_date', '-id')
+    cursor_query_param = CURSOR_QUERY_PARAM
     page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = CursorPagination.invalid_cursor_message
+
+    def paginate_queryset(self, get_page, request, view=None):
+        self.request = request
+        page_size = PageNumberPagination.get_page_size(self, request)
+        recipes = list(get_page(self.decode_cursor(request), page_size + 1))
+        self.next_cursor = None
+        if len(recipes) > page_size:
+            recipes = recipes[:page_size]
+            self.next_cursor = self.encode_cursor(recipes[-1])
+        return recipes
+
+    def get_fields(self):
+        return [
+            self.model._meta.get_field(field.lstrip('-'))
+            for field in self.ordering
+        ]
+
+    def encode_cursor(self, recipe):
+        values = []
+        for field in self.get_fields():
+            value = getattr(recipe, field.attname)
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat')
+                else str(value)
+            )
+        return urlsafe_b64encode(','.join(values).encode()).decode()
+
+    def decode_cursor(self, request):
+        value = request.query_params.get(self.cursor_query_param)
+        if not value:
+            return None
+        fields = self.get_fields()
+        try:
+            values = urlsafe_b64decode(value.encode()).decode().split(',')
+            if len(values) != len(fields):
+                raise ValueError
+            return tuple(
+                field.to_python(value)
+                for field, value in zip(fields, values)
+            )
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
@@ -0,0 +1,17 @@
+from rest_framework.parsers import BaseParser
+
+from recipes.bulk_import import read_ndjson
+
+
+class NDJSONParser(BaseParser):
+    """
+    Разбирает NDJSON построчно в список пар (номер строки, объект).
+
+    Ошибки разбора приходят как RecipeImportError при обращении
+    к request.data, чтобы view отдал их вместе с номерами строк.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return read_ndjson(stream)
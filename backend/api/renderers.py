@@ -0,0 +1,140 @@
+import csv
+import json
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+from config import SHOPPING_CART_PDF_FONT, SHOPPING_CART_TITLE
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """
+    Формат файла списка покупок, по умолчанию - текст.
+
+    Файл собирает stream(), render() нужен только для ошибок. Если
+    streamed ложно, файл собирается целиком и отдаётся обычным ответом.
+    """
+
+    charset = 'utf-8'
+    streamed = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode()
+
+    def get_content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    def stream(self, ingredients):
+        """Файл по частям: заголовок и по строке на ингредиент."""
+        yield self.get_header().encode()
+        for item in ingredients:
+            yield self.get_line(item).encode()
+
+    def get_header(self):
+        return f'{SHOPPING_CART_TITLE}:\n\n'
+
+    def get_line(self, item):
+        return (f'{item["ingredient__name"]} - {item["total_amount"]}'
+                f'{item["ingredient__measurement_unit"]}\n')
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class Echo:
+    """Файлоподобный объект, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+
+    media_type = 'text/csv'
+    format = 'csv'
+    writer = csv.writer(Echo())
+
+    def get_header(self):
+        return self.writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+
+    def get_line(self, item):
+        return self.writer.writerow((
+            item['ingredient__name'],
+            item['total_amount'],
+            item['ingredient__measurement_unit'],
+        ))
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    """
+    PDF собирается целиком и отдаётся одним ответом.
+
+    reportlab пишет документ только в Canvas.save(), поэтому отдавать
+    его по частям раньше, чем он собран, нечего.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    streamed = False
+    font_size = 12
+    line_height = 18
+    margin = 50
+
+    @staticmethod
+    def get_font_name():
+        """
+        Регистрирует шрифт из PDF_FONT_PATH.
+
+        Встроенные шрифты reportlab не содержат кириллицы, поэтому без
+        файла шрифта PDF не собирается.
+        """
+        font_path = settings.PDF_FONT_PATH
+        if not os.path.exists(font_path):
+            raise ImproperlyConfigured(
+                f'Нет файла шрифта PDF_FONT_PATH: {font_path}.'
+            )
+        if SHOPPING_CART_PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(SHOPPING_CART_PDF_FONT, font_path))
+        return SHOPPING_CART_PDF_FONT
+
+    def stream(self, ingredients):
+        return [self.render_pdf(ingredients, self.get_font_name())]
+
+    def render_pdf(self, ingredients, font_name):
+        buffer = BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        y = height - self.margin
+        pdf.setFont(font_name, self.font_size)
+        pdf.drawString(self.margin, y, f'{SHOPPING_CART_TITLE}:')
+        for item in ingredients:
+            y -= self.line_height
+            if y < self.margin:
+                pdf.showPage()
+                pdf.setFont(font_name, self.font_size)
+                y = height - self.margin
+            pdf.drawString(
+                self.margin,
+                y,
+                f'{item["ingredient__name"]} - {item["total_amount"]} '
+                f'{item["ingredient__measurement_unit"]}'
+            )
+        pdf.save()
+        return buffer.getvalue()
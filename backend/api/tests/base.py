@@ -0,0 +1,107 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.serializers import RecipeWriteSerializer
+from config import RECIPES_VERSION_KEY
+from recipes.models import DataVersion, Ingredient, Recipe, Tag, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def get_png():
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), (200, 10, 10)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def get_image():
+    return 'data:image/png;base64,' + base64.b64encode(get_png()).decode()
+
+
+def create_user(username, **fields):
+    return User.objects.create_user(
+        email=f'{username}@example.com',
+        username=username,
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password-12345',
+        **fields
+    )
+
+
+def get_client(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeTestCase(TestCase):
+    """Автор, теги и ингредиенты; рецепты пишутся сериализатором API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        DataVersion.bump(RECIPES_VERSION_KEY)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Ключи кэша строятся из id и версий, которые повторяются
+        # в каждом тесте.
+        cache.clear()
+        self.client = get_client(self.author)
+
+    def get_data(self, **changes):
+        return {
+            'name': 'Суп',
+            'text': 'Сварить.',
+            'cooking_time': 10,
+            'tags': [self.tags[0].id, self.tags[1].id],
+            'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 100},
+                {'id': self.ingredients[1].id, 'amount': 200},
+            ],
+            **changes,
+        }
+
+    def save(self, instance=None, author=None, **data):
+        request = Request(APIRequestFactory().post('/'))
+        request.user = author or self.author
+        serializer = RecipeWriteSerializer(
+            instance,
+            data=data,
+            partial=instance is not None,
+            context={'request': request},
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def create_recipe(self, author=None, **changes):
+        recipe = self.save(
+            author=author,
+            **self.get_data(image=get_image(), **changes)
+        )
+        return Recipe.objects.get(pk=recipe.pk)
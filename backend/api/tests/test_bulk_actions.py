@@ -0,0 +1,169 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.tests.base import RecipeTestCase, create_user, get_client
+from recipes.counters import recount_counters
+from recipes.models import Favorite, FeedItem, Recipe, ShoppingCart, User
+from recipes.shopping_lists import find_drifted_users
+
+FAVORITE_URL = '/api/recipes/favorite/'
+SHOPPING_CART_URL = '/api/recipes/shopping_cart/'
+SUBSCRIBE_URL = '/api/users/subscribe/'
+
+
+class BulkActionTests(RecipeTestCase):
+    """Пакетные избранное, корзина и подписки."""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = create_user('reader')
+        self.reader_client = get_client(self.reader)
+        self.recipes = [self.create_recipe() for _ in range(5)]
+        self.ids = [recipe.id for recipe in self.recipes]
+        self.missing = max(self.ids) + 1
+
+    def request(self, method, url, key, ids):
+        response = getattr(self.reader_client, method)(
+            url, {key: ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result['id'], result['status'], result.get('error'))
+            for result in response.data['results']
+        ]
+
+    def count_queries(self, method, url, key, ids):
+        with CaptureQueriesContext(connection) as context:
+            self.request(method, url, key, ids)
+        return len(context.captured_queries)
+
+    def assertConsistent(self):
+        # Пересчёт с нуля не должен найти расхождений.
+        self.assertEqual(set(recount_counters().values()), {0})
+        self.assertEqual(find_drifted_users(), [])
+
+    def test_partial_success(self):
+        first, second = self.ids[:2]
+        self.reader_client.post(f'/api/recipes/{first}/favorite/')
+        self.assertEqual(
+            self.request(
+                'post', FAVORITE_URL, 'recipes',
+                [first, second, self.missing, second]
+            ),
+            [
+                (first, 400, 'Уже добавлен в Избранное'),
+                (second, 201, None),
+                (
+                    self.missing, 400,
+                    f'Недопустимый первичный ключ "{self.missing}" - '
+                    'объект не существует.'
+                ),
+            ]
+        )
+        self.assertEqual(
+            set(Favorite.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', flat=True)),
+            {first, second}
+        )
+        self.assertEqual(
+            self.request(
+                'delete', FAVORITE_URL, 'recipes',
+                [second, self.missing, second]
+            ),
+            [
+                (second, 204, None),
+                (self.missing, 400, 'Не добавлен в Избранное'),
+            ]
+        )
+        self.assertConsistent()
+
+    def test_shopping_cart(self):
+        self.assertEqual(
+            {
+                result[1] for result in self.request(
+                    'post', SHOPPING_CART_URL, 'recipes', self.ids
+                )
+            },
+            {201}
+        )
+        self.assertEqual(
+            ShoppingCart.objects.filter(user=self.reader).count(), 5
+        )
+        self.assertEqual(set(Recipe.objects.values_list(
+            'popularity', flat=True
+        )), {1})
+        self.assertConsistent()
+        self.request(
+            'delete', SHOPPING_CART_URL, 'recipes', self.ids[:3]
+        )
+        self.assertEqual(
+            set(ShoppingCart.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', flat=True)),
+            set(self.ids[3:])
+        )
+        self.assertConsistent()
+
+    def test_subscribe(self):
+        other = create_user('other')
+        self.assertEqual(
+            self.request(
+                'post', SUBSCRIBE_URL, 'authors',
+                [self.author.id, self.reader.id, other.id, self.author.id]
+            ),
+            [
+                (self.author.id, 201, None),
+                (self.reader.id, 400, 'Нельзя подписаться на самого себя!'),
+                (other.id, 201, None),
+            ]
+        )
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).subscribers_count, 1
+        )
+        self.assertEqual(
+            set(FeedItem.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', flat=True)),
+            set(self.ids)
+        )
+        self.assertEqual(
+            self.request(
+                'delete', SUBSCRIBE_URL, 'authors',
+                [self.author.id, self.author.id]
+            ),
+            [(self.author.id, 204, None)]
+        )
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+        self.assertConsistent()
+
+    def test_constant_queries(self):
+        for method, url, key, small, large in (
+            ('post', FAVORITE_URL, 'recipes', self.ids[:1], self.ids[1:]),
+            ('delete', FAVORITE_URL, 'recipes', self.ids[:1], self.ids[1:]),
+            (
+                'post', SHOPPING_CART_URL, 'recipes',
+                self.ids[:1], self.ids[1:]
+            ),
+            (
+                'delete', SHOPPING_CART_URL, 'recipes',
+                self.ids[:1], self.ids[1:]
+            ),
+        ):
+            with self.subTest(method=method, url=url):
+                self.assertEqual(
+                    self.count_queries(method, url, key, small),
+                    self.count_queries(method, url, key, large)
+                )
+        authors = [create_user(f'author{i}') for i in range(4)]
+        for method in ('post', 'delete'):
+            with self.subTest(method=method, url=SUBSCRIBE_URL):
+                self.assertEqual(
+                    self.count_queries(
+                        method, SUBSCRIBE_URL, 'authors', [authors[0].id]
+                    ),
+                    self.count_queries(
+                        method, SUBSCRIBE_URL, 'authors',
+                        [author.id for author in authors[1:]]
+                    )
+                )
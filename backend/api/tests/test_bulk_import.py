@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+
+from api.tests.base import RecipeTestCase, create_user, get_client, get_png
+from recipes.models import Recipe, User
+
+URL = '/api/recipes/import/'
+
+
+class RecipeImportTests(RecipeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = create_user('admin', is_staff=True)
+        self.admin_client = get_client(self.admin)
+        self.image = default_storage.save(
+            'recipes/images/import.png',
+            ContentFile(get_png())
+        )
+
+    def get_record(self, **changes):
+        return {
+            'author': self.author.username,
+            'name': 'Суп',
+            'text': 'Сварить.',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [self.tags[0].slug],
+            'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 100},
+                {'name': 'Ингредиент 1', 'measurement_unit': 'г',
+                 'amount': 200},
+            ],
+            **changes,
+        }
+
+    def post(self, *records, client=None):
+        return (client or self.admin_client).post(
+            URL,
+            '\n'.join(json.dumps(record) for record in records),
+            content_type='application/x-ndjson'
+        )
+
+    def test_import(self):
+        response = self.post(self.get_record(), self.get_record(name='Борщ'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'created': 2})
+        recipes = Recipe.objects.order_by('id')
+        self.assertEqual(
+            [recipe.name for recipe in recipes],
+            ['Суп', 'Борщ']
+        )
+        for recipe in recipes:
+            self.assertEqual(recipe.author, self.author)
+            self.assertEqual(recipe.cache_version, 1)
+            self.assertEqual(
+                list(recipe.tags.values_list('id', flat=True)),
+                [self.tags[0].id]
+            )
+            self.assertEqual(
+                sorted(recipe.ingredientsrecipes.values_list(
+                    'ingredient_id', 'amount'
+                )),
+                [(self.ingredients[0].id, 100), (self.ingredients[1].id, 200)]
+            )
+        self.assertEqual(User.objects.get(pk=self.author.pk).recipes_count, 2)
+        response = self.client.get('/api/recipes/', {'search': 'борщ'})
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[1].id]
+        )
+
+    def test_import_does_not_reuse_deleted_ids(self):
+        recipe = self.create_recipe()
+        deleted_id = recipe.id
+        self.client.get(f'/api/recipes/{deleted_id}/')
+        recipe.delete()
+        self.assertEqual(self.post(self.get_record()).status_code, 201)
+        imported = Recipe.objects.get()
+        self.assertGreater(imported.id, deleted_id)
+        self.assertEqual(
+            self.client.get(f'/api/recipes/{imported.id}/').data['name'],
+            'Суп'
+        )
+
+    def test_import_errors(self):
+        response = self.post(
+            self.get_record(),
+            self.get_record(tags=['missing'], cooking_time=0),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors_count'], 2)
+        self.assertEqual(
+            [error['line'] for error in response.data['errors']],
+            [2, 2]
+        )
+        self.assertFalse(Recipe.objects.exists())
+        response = self.admin_client.post(
+            URL,
+            '{"name": ',
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['line'], 1)
+
+    def test_import_requires_admin(self):
+        response = self.post(self.get_record(), client=self.client)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'soup.png'), 'wb') as image:
+                image.write(get_png())
+            path = os.path.join(directory, 'recipes.ndjson')
+            with open(path, 'w', encoding='utf-8') as lines:
+                record = self.get_record(image='soup.png')
+                del record['author']
+                lines.write(json.dumps(record) + '\n')
+            call_command(
+                'import_recipes',
+                path,
+                author=self.author.username,
+                images_dir=directory,
+                skip_image_variants=True,
+                stdout=StringIO(),
+            )
+            recipe = Recipe.objects.get()
+            self.assertEqual(recipe.author, self.author)
+            self.assertTrue(default_storage.exists(recipe.image.name))
+            with open(path, 'w', encoding='utf-8') as lines:
+                lines.write(json.dumps(self.get_record(image='none.png')))
+            with self.assertRaises(CommandError):
+                call_command('import_recipes', path, stdout=StringIO())
+        self.assertEqual(Recipe.objects.count(), 1)
@@ -0,0 +1,114 @@
+from io import StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client
+
+from api.tests.base import (RecipeTestCase, create_user, get_client, get_image,
+                            get_png)
+from recipes.counters import recount_counters
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscription, User
+from recipes.shopping_lists import find_drifted_users
+
+
+class CounterTests(RecipeTestCase):
+    """Счётчики recipes_count, subscribers_count и favorites_count."""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = create_user('reader')
+        self.reader_client = get_client(self.reader)
+        self.admin_client = Client()
+        self.admin_client.force_login(
+            create_user('admin', is_staff=True, is_superuser=True)
+        )
+
+    def assertCounters(self, recipes_count, subscribers_count,
+                       favorites_count=None, recipe=None):
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(author.recipes_count, recipes_count)
+        self.assertEqual(author.subscribers_count, subscribers_count)
+        if recipe is not None:
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.favorites_count, favorites_count)
+        # Пересчёт с нуля не должен найти расхождений.
+        self.assertEqual(set(recount_counters().values()), {0})
+        self.assertEqual(find_drifted_users(), [])
+
+    def test_api_keeps_counters(self):
+        response = self.client.post(
+            '/api/recipes/',
+            self.get_data(image=get_image()),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.reader_client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.reader_client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.reader_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertCounters(1, 1, 1, recipe)
+        self.reader_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        self.reader_client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertCounters(1, 0, 0, recipe)
+        response = self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertCounters(0, 0)
+
+    def admin_post(self, url, data):
+        response = self.admin_client.post(f'/admin/recipes/{url}', data)
+        self.assertEqual(response.status_code, 302)
+
+    def test_admin_keeps_counters(self):
+        self.admin_post('recipe/add/', {
+            'author': self.author.id,
+            'name': 'Суп',
+            'image': SimpleUploadedFile('soup.png', get_png()),
+            'text': 'Сварить.',
+            'cooking_time': 10,
+            'tags': [self.tags[0].id],
+            'ingredientsrecipes-TOTAL_FORMS': 1,
+            'ingredientsrecipes-INITIAL_FORMS': 0,
+            'ingredientsrecipes-0-ingredient': self.ingredients[0].id,
+            'ingredientsrecipes-0-amount': 100,
+        })
+        recipe = Recipe.objects.get()
+        self.admin_post('subscription/add/', {
+            'subscriber': self.reader.id,
+            'author': self.author.id,
+        })
+        self.admin_post('favorite/add/', {
+            'user': self.reader.id,
+            'recipe': recipe.id,
+        })
+        self.admin_post('shoppingcart/add/', {
+            'user': self.reader.id,
+            'recipe': recipe.id,
+        })
+        self.assertCounters(1, 1, 1, recipe)
+        self.admin_post(
+            f'subscription/{Subscription.objects.get().id}/delete/',
+            {'post': 'yes'}
+        )
+        self.admin_post('favorite/', {
+            'action': 'delete_selected',
+            '_selected_action': list(
+                Favorite.objects.values_list('id', flat=True)
+            ),
+            'post': 'yes',
+        })
+        self.assertCounters(1, 0, 0, recipe)
+        self.admin_post(f'recipe/{recipe.id}/delete/', {'post': 'yes'})
+        self.assertCounters(0, 0)
+        self.assertFalse(ShoppingCart.objects.exists())
+
+    def test_recount_counters_fixes_drift(self):
+        recipe = self.create_recipe()
+        Subscription.objects.create(subscriber=self.reader, author=self.author)
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        User.objects.filter(pk=self.author.pk).update(
+            recipes_count=5,
+            subscribers_count=0,
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=3)
+        call_command('recount_counters', stdout=StringIO())
+        self.assertCounters(1, 1, 1, recipe)
@@ -0,0 +1,20 @@
+from django.test import TestCase
+
+from recipes.models import DataVersion
+
+
+class DataVersionTests(TestCase):
+
+    def test_bump_is_one_query(self):
+        with self.assertNumQueries(1):
+            DataVersion.bump('first', 'second', 'first')
+        with self.assertNumQueries(1):
+            DataVersion.bump('second', 'third')
+        self.assertEqual(DataVersion.get_version('first'), 1)
+        self.assertEqual(DataVersion.get_version('second'), 2)
+        self.assertEqual(DataVersion.get_version('third'), 1)
+        self.assertEqual(DataVersion.get_version('missing'), 0)
+
+    def test_bump_without_keys(self):
+        with self.assertNumQueries(0):
+            DataVersion.bump()
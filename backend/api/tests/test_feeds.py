@@ -0,0 +1,119 @@
+from api.tests.base import RecipeTestCase, create_user, get_client, get_image
+from config import FEED_FANOUT_MAX_SUBSCRIBERS
+from recipes.feeds import rebuild_feeds
+from recipes.models import FeedItem, Recipe, User
+
+URL = '/api/recipes/feed/'
+
+
+class FeedTests(RecipeTestCase):
+    """
+    Лента подписок: рецепты раскладываются по лентам при записи, а рецепты
+    популярных авторов (in_feeds=False) подмешиваются при чтении.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.reader = create_user('reader')
+        self.reader_client = get_client(self.reader)
+        self.popular = create_user('popular')
+        User.objects.filter(pk=self.popular.pk).update(
+            subscribers_count=FEED_FANOUT_MAX_SUBSCRIBERS
+        )
+        self.stranger = create_user('stranger')
+        for author in (self.author, self.popular, self.stranger):
+            self.create_recipe(author=author)
+            self.create_recipe(author=author)
+
+    def subscribe(self, author):
+        response = self.reader_client.post(
+            f'/api/users/{author.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def unsubscribe(self, author):
+        response = self.reader_client.delete(
+            f'/api/users/{author.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+
+    def get_feed(self):
+        """Проходит ленту по курсору страницами по 2 рецепта."""
+        ids = []
+        url = URL + '?limit=2'
+        while url:
+            response = self.reader_client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def assertFeed(self, *authors):
+        expected = list(Recipe.objects.filter(
+            author__in=authors
+        ).order_by('-pub_date', '-id').values_list('id', flat=True))
+        self.assertEqual(self.get_feed(), expected)
+
+    def test_subscribe_and_unsubscribe(self):
+        self.assertFeed()
+        self.subscribe(self.author)
+        self.assertFeed(self.author)
+        self.subscribe(self.popular)
+        self.assertFeed(self.author, self.popular)
+        self.unsubscribe(self.author)
+        self.assertFeed(self.popular)
+        self.assertFalse(FeedItem.objects.filter(
+            user=self.reader, author=self.author
+        ).exists())
+        self.unsubscribe(self.popular)
+        self.assertFeed()
+
+    def test_publish_and_delete(self):
+        self.subscribe(self.author)
+        self.subscribe(self.popular)
+        response = self.client.post(
+            '/api/recipes/', self.get_data(image=get_image()), format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        published = response.data['id']
+        self.assertEqual(self.get_feed()[0], published)
+        self.assertFeed(self.author, self.popular)
+        self.assertTrue(
+            FeedItem.objects.filter(
+                user=self.reader, recipe=published
+            ).exists()
+        )
+        response = self.client.delete(f'/api/recipes/{published}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFeed(self.author, self.popular)
+        self.assertNotIn(published, self.get_feed())
+
+    def test_popular_author_is_not_fanned_out(self):
+        self.subscribe(self.popular)
+        User.objects.filter(pk=self.popular.pk).update(
+            subscribers_count=FEED_FANOUT_MAX_SUBSCRIBERS + 1
+        )
+        recipe = self.create_recipe(author=self.popular)
+        recipe.refresh_from_db()
+        self.assertFalse(recipe.in_feeds)
+        self.assertFalse(FeedItem.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.get_feed()[0], recipe.id)
+        self.assertFeed(self.popular)
+        recipe.delete()
+        self.assertFeed(self.popular)
+
+    def test_rebuild_feeds(self):
+        self.subscribe(self.author)
+        self.subscribe(self.popular)
+        User.objects.filter(pk=self.popular.pk).update(
+            subscribers_count=FEED_FANOUT_MAX_SUBSCRIBERS + 1
+        )
+        rebuild_feeds()
+        self.assertFalse(
+            FeedItem.objects.filter(author=self.popular).exists()
+        )
+        self.assertFalse(Recipe.objects.filter(
+            author=self.popular, in_feeds=True
+        ).exists())
+        self.assertFeed(self.author, self.popular)
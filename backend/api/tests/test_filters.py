@@ -0,0 +1,53 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.tests.base import RecipeTestCase
+from recipes.models import Tag
+
+
+class RecipeTagFilterTests(RecipeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.create_recipe(tags=[self.tags[0].id])
+        self.second = self.create_recipe(
+            tags=[self.tags[1].id, self.tags[2].id]
+        )
+
+    def get_ids(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def count_queries(self, **params):
+        self.client.get('/api/recipes/', params)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/recipes/', params)
+        return len(context.captured_queries)
+
+    def test_filter(self):
+        self.assertEqual(self.get_ids(tags='tag0'), [self.first.id])
+        self.assertEqual(
+            self.get_ids(tags=['tag1', 'tag2']),
+            [self.second.id]
+        )
+        self.assertEqual(
+            self.get_ids(tags=['tag0', 'tag2']),
+            [self.second.id, self.first.id]
+        )
+
+    def test_unknown_tag(self):
+        response = self.client.get('/api/recipes/', {'tags': 'missing'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('missing', str(response.data['tags'][0]))
+
+    def test_new_tag_is_accepted(self):
+        self.get_ids(tags='tag0')
+        Tag.objects.create(name='Новый', color='#000009', slug='new')
+        self.assertEqual(self.get_ids(tags='new'), [])
+
+    def test_filtered_page_costs_as_unfiltered(self):
+        self.assertEqual(
+            self.count_queries(tags=['tag0', 'tag1']),
+            self.count_queries()
+        )
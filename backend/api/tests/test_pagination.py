@@ -0,0 +1,100 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.tests.base import RecipeTestCase, create_user, get_client
+from recipes.models import Recipe
+
+
+class RecipeCursorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {i}',
+                text='Сварить.',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            for i in range(6)
+        ]
+        Recipe.objects.update(popularity=5)
+
+    def test_popular_cursor_keeps_unchanged_recipes(self):
+        response = self.client.get(
+            '/api/recipes/',
+            {'cursor': '', 'limit': 2, 'ordering': 'popular'}
+        )
+        ids = [recipe['id'] for recipe in response.data['results']]
+        # Просмотренный рецепт уходит в конец: смещение среди равных
+        # значений сдвинулось бы, и один из рецептов пропал бы.
+        Recipe.objects.filter(id=ids[0]).update(popularity=0)
+        next_link = response.data['next']
+        while next_link:
+            response = self.client.get(next_link)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            next_link = response.data['next']
+        self.assertLessEqual(
+            {recipe.id for recipe in self.recipes},
+            set(ids)
+        )
+        self.assertEqual(len(ids), len(self.recipes) + 1)
+
+
+class CountCacheTests(RecipeTestCase):
+    """Число рецептов в выдаче кэшируется по фильтрам и версиям данных."""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = create_user('reader')
+        self.reader_client = get_client(self.reader)
+        for _ in range(3):
+            self.create_recipe()
+
+    def get_count(self, client, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/recipes/', {'limit': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        counted = any(
+            'COUNT(' in query['sql'] for query in context.captured_queries
+        )
+        return response.data['count'], counted
+
+    def test_shared_between_users(self):
+        self.assertEqual(self.get_count(self.client), (3, True))
+        self.assertEqual(self.get_count(self.reader_client), (3, False))
+        self.assertEqual(self.get_count(get_client()), (3, False))
+        self.assertEqual(self.get_count(self.client, page=2), (3, False))
+        self.assertEqual(self.get_count(self.client, tags='tag0'), (3, True))
+        self.assertEqual(self.get_count(self.client, tags='tag2'), (0, True))
+
+    def test_recipe_changes(self):
+        self.get_count(self.client)
+        recipe = self.create_recipe()
+        self.assertEqual(self.get_count(self.reader_client), (4, True))
+        self.save(recipe, **self.get_data(tags=[self.tags[2].id]))
+        self.assertEqual(self.get_count(self.client, tags='tag2'), (1, True))
+        self.assertEqual(self.get_count(self.client, tags='tag2'), (1, False))
+
+    def test_user_filters(self):
+        recipe = Recipe.objects.latest('id')
+        self.reader_client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(
+            self.get_count(self.reader_client, is_favorited=1), (1, True)
+        )
+        self.assertEqual(self.get_count(self.client, is_favorited=1)[0], 0)
+        self.assertEqual(
+            self.get_count(self.reader_client, is_favorited=1), (1, False)
+        )
+        self.reader_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(
+            self.get_count(self.reader_client, is_favorited=1)[0], 0
+        )
+        self.reader_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(
+            self.get_count(self.reader_client, is_in_shopping_cart=1),
+            (1, True)
+        )
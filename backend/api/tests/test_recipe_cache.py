@@ -0,0 +1,77 @@
+from django.db.models import F
+
+from api.tests.base import RecipeTestCase, create_user, get_client
+from recipes.models import Recipe
+
+
+class RecipeCacheTests(RecipeTestCase):
+    """Список и рецепт, собранные из кэша, не отстают от данных."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe()
+        self.reader_client = get_client(create_user('reader'))
+
+    def get(self, client=None):
+        client = client or self.client
+        detail = client.get(f'/api/recipes/{self.recipe.id}/').data
+        [listed] = client.get('/api/recipes/').data['results']
+        return detail, listed
+
+    def assertFresh(self, client=None, **values):
+        for data in self.get(client):
+            for field, value in values.items():
+                self.assertEqual(data[field], value, field)
+
+    def test_edit_resets_cache(self):
+        self.get()
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            self.get_data(name='Борщ', cooking_time=20),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFresh(name='Борщ', cooking_time=20)
+
+    def test_tags_change_resets_cache(self):
+        self.get()
+        self.recipe.tags.set([self.tags[2]])
+        for data in self.get():
+            self.assertEqual(
+                [tag['id'] for tag in data['tags']],
+                [self.tags[2].id]
+            )
+
+    def test_favorite_and_cart_reset_flags(self):
+        self.get(self.reader_client)
+        url = f'/api/recipes/{self.recipe.id}'
+        self.reader_client.post(f'{url}/favorite/')
+        self.reader_client.post(f'{url}/shopping_cart/')
+        self.assertFresh(
+            self.reader_client,
+            is_favorited=True,
+            is_in_shopping_cart=True
+        )
+        self.assertFresh(is_favorited=False, is_in_shopping_cart=False)
+        self.reader_client.delete(f'{url}/favorite/')
+        self.reader_client.delete(f'{url}/shopping_cart/')
+        self.assertFresh(
+            self.reader_client,
+            is_favorited=False,
+            is_in_shopping_cart=False
+        )
+
+    def test_save_keeps_concurrent_version_bump(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        # Воркер картинок поднял версию между чтением и записью.
+        Recipe.objects.filter(pk=recipe.pk).update(
+            cache_version=F('cache_version') + 1
+        )
+        bumped = Recipe.objects.get(pk=recipe.pk).cache_version
+        recipe.name = 'Борщ'
+        recipe.save()
+        self.assertEqual(recipe.cache_version, bumped + 1)
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).cache_version,
+            bumped + 1
+        )
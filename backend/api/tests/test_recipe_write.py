@@ -0,0 +1,75 @@
+from django.db import connection
+
+from api.indexes import RecipeIngredientIndex
+from api.tests.base import RecipeTestCase, get_image
+
+# SAVEPOINT и RELEASE: внутри TestCase transaction.atomic не открывает
+# новую транзакцию.
+ATOMIC_QUERIES = 2
+
+
+class RecipeWriteTests(RecipeTestCase):
+
+    def assertWriteQueries(self, budget, search=False):
+        """Бюджет из docstring RecipeWriteSerializer."""
+        if search:
+            budget += 1 if connection.vendor == 'postgresql' else 4
+        return self.assertNumQueries(budget + ATOMIC_QUERIES)
+
+    def test_create_queries(self):
+        with self.assertWriteQueries(23, search=True):
+            self.save(**self.get_data(image=get_image()))
+
+    def test_update_queries(self):
+        recipe = self.create_recipe()
+        with self.assertWriteQueries(10, search=True):
+            self.save(recipe, **self.get_data(name='Борщ'))
+
+    def test_ingredients_update_queries(self):
+        recipe = self.create_recipe()
+        with self.assertWriteQueries(20, search=True):
+            self.save(recipe, **self.get_data(ingredients=[
+                {'id': self.ingredients[0].id, 'amount': 150},
+                {'id': self.ingredients[2].id, 'amount': 300},
+            ]))
+
+    def test_unchanged_update_queries(self):
+        recipe = self.create_recipe()
+        with self.assertWriteQueries(4):
+            self.save(recipe, **self.get_data())
+
+    def test_update_tags_only(self):
+        recipe = self.create_recipe()
+        self.client.get(f'/api/recipes/{recipe.id}/')
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.get_data(tags=[self.tags[2].id]),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [tag['id'] for tag in response.data['tags']],
+            [self.tags[2].id]
+        )
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(
+            [tag['id'] for tag in response.data['tags']],
+            [self.tags[2].id]
+        )
+
+    def test_index_refresh_reads_only_changed_recipes(self):
+        recipe = self.create_recipe()
+        deleted_recipe = self.create_recipe()
+        index = RecipeIngredientIndex()
+        index.refresh(0)
+        self.save(recipe, **self.get_data(ingredients=[
+            {'id': self.ingredients[2].id, 'amount': 300},
+        ]))
+        deleted_recipe.delete()
+        # Журнал изменений, сами рецепты, их ингредиенты и теги.
+        with self.assertNumQueries(4):
+            index.refresh(1)
+        self.assertEqual(
+            index.find([self.ingredients[0].id, self.ingredients[2].id]),
+            [(recipe.id, 1, 0)]
+        )
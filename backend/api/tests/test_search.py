@@ -0,0 +1,35 @@
+from django.db import connection
+
+from api.tests.base import RecipeTestCase
+from recipes.models import Recipe
+from recipes.search import SEARCH_TABLE
+
+
+class RecipeSearchTests(RecipeTestCase):
+
+    def search(self, text):
+        response = self.client.get('/api/recipes/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_search_follows_recipe_changes(self):
+        recipe = self.create_recipe(name='Грибной суп')
+        self.assertEqual(self.search('грибного'), [recipe.id])
+        self.save(recipe, **self.get_data(name='Борщ'))
+        self.assertEqual(self.search('грибного'), [])
+        self.assertEqual(self.search('борщи'), [recipe.id])
+        self.assertEqual(self.search('ингредиент'), [recipe.id])
+        recipe.delete()
+        self.assertEqual(self.search('борщ'), [])
+
+    def test_deleted_recipe_leaves_no_document(self):
+        recipe_id = self.create_recipe().id
+        Recipe.objects.get(id=recipe_id).delete()
+        if connection.vendor == 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE rowid = %s',
+                [recipe_id]
+            )
+            self.assertEqual(cursor.fetchone(), (0,))
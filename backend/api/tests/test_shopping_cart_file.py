@@ -0,0 +1,68 @@
+import csv
+import os
+from io import StringIO
+
+from django.conf import settings
+
+from api.tests.base import RecipeTestCase
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+class ShoppingCartFileTests(RecipeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe()
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+
+    def download(self, file_format):
+        response = self.client.get(URL, {'format': file_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename=Shopping cart.{file_format}'
+        )
+        if response.streaming:
+            return response, b''.join(response.streaming_content)
+        return response, response.content
+
+    def test_txt(self):
+        response, content = self.download('txt')
+        self.assertEqual(
+            response['Content-Type'],
+            'text/plain; charset=utf-8'
+        )
+        self.assertEqual(
+            content.decode(),
+            'Список покупок:\n\nИнгредиент 0 - 100г\nИнгредиент 1 - 200г\n'
+        )
+
+    def test_csv(self):
+        response, content = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(list(csv.reader(StringIO(content.decode()))), [
+            ['Ингредиент', 'Количество', 'Единица измерения'],
+            ['Ингредиент 0', '100', 'г'],
+            ['Ингредиент 1', '200', 'г'],
+        ])
+
+    def test_pdf(self):
+        if not os.path.exists(settings.PDF_FONT_PATH):
+            self.skipTest('Нет файла шрифта PDF_FONT_PATH.')
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertFalse(response.streaming)
+        self.assertEqual(response['Content-Length'], str(len(content)))
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_cached_file_follows_cart(self):
+        _, content = self.download('txt')
+        self.assertEqual(self.download('txt')[1], content)
+        other = self.create_recipe(ingredients=[
+            {'id': self.ingredients[2].id, 'amount': 50},
+        ])
+        self.client.post(f'/api/recipes/{other.id}/shopping_cart/')
+        self.assertIn('Ингредиент 2 - 50г', self.download('txt')[1].decode())
+        self.client.delete(f'/api/recipes/{other.id}/shopping_cart/')
+        self.assertEqual(self.download('txt')[1], content)
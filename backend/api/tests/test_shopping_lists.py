@@ -0,0 +1,123 @@
+import csv
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+
+from api.tests.base import RecipeTestCase, create_user, get_client
+from recipes.models import IngredientRecipe, ShoppingListItem
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+class ShoppingListTests(RecipeTestCase):
+    """Список покупок пишется разницами и должен совпадать с агрегатом."""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = create_user('reader')
+        self.reader_client = get_client(self.reader)
+        self.soup = self.create_recipe()
+        self.salad = self.create_recipe(ingredients=[
+            {'id': self.ingredients[1].id, 'amount': 50},
+            {'id': self.ingredients[2].id, 'amount': 10},
+        ])
+
+    def add(self, recipe, client=None):
+        response = (client or self.reader_client).post(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def download(self, client=None):
+        response = (client or self.reader_client).get(URL, {'format': 'csv'})
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        return {
+            (name, unit): int(amount)
+            for name, amount, unit in list(
+                csv.reader(StringIO(content.decode()))
+            )[1:]
+        }
+
+    def assertShoppingList(self, user=None, client=None):
+        user = user or self.reader
+        downloaded = self.download(client)
+        expected = {
+            (item['ingredient__name'], item['ingredient__measurement_unit']):
+                item['total']
+            for item in IngredientRecipe.objects.filter(
+                recipe__shoppingcarts__user=user
+            ).values(
+                'ingredient__name',
+                'ingredient__measurement_unit'
+            ).annotate(total=Sum('amount'))
+        }
+        self.assertEqual(downloaded, expected)
+        return downloaded
+
+    def test_add_and_remove(self):
+        self.assertEqual(self.assertShoppingList(), {})
+        self.add(self.soup)
+        self.add(self.salad)
+        self.assertEqual(self.assertShoppingList(), {
+            ('Ингредиент 0', 'г'): 100,
+            ('Ингредиент 1', 'г'): 250,
+            ('Ингредиент 2', 'г'): 10,
+        })
+        self.add(self.salad, self.client)
+        self.assertShoppingList(self.author, self.client)
+        self.reader_client.delete(
+            f'/api/recipes/{self.soup.id}/shopping_cart/'
+        )
+        self.assertEqual(self.assertShoppingList(), {
+            ('Ингредиент 1', 'г'): 50,
+            ('Ингредиент 2', 'г'): 10,
+        })
+
+    def test_recipe_ingredients_change(self):
+        self.add(self.soup)
+        self.add(self.salad)
+        self.assertShoppingList()
+        response = self.client.patch(
+            f'/api/recipes/{self.salad.id}/',
+            self.get_data(ingredients=[
+                {'id': self.ingredients[0].id, 'amount': 5},
+                {'id': self.ingredients[1].id, 'amount': 70},
+            ]),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.assertShoppingList(), {
+            ('Ингредиент 0', 'г'): 105,
+            ('Ингредиент 1', 'г'): 270,
+        })
+
+    def test_recipe_delete(self):
+        self.add(self.soup)
+        self.add(self.salad)
+        self.assertShoppingList()
+        self.client.delete(f'/api/recipes/{self.salad.id}/')
+        self.assertEqual(self.assertShoppingList(), {
+            ('Ингредиент 0', 'г'): 100,
+            ('Ингредиент 1', 'г'): 200,
+        })
+
+    def test_rebuild(self):
+        self.add(self.soup)
+        self.add(self.salad)
+        ShoppingListItem.objects.filter(user=self.reader).update(
+            total_amount=1
+        )
+        self.assertEqual(set(self.download().values()), {1})
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', check=True,
+                         stdout=StringIO())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertShoppingList()
+        ShoppingListItem.objects.all().delete()
+        call_command('rebuild_shopping_lists', all=True, stdout=StringIO())
+        self.assertShoppingList()
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
@@ -0,0 +1,82 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from api.tests.base import RecipeTestCase, create_user, get_client
+from recipes.models import Favorite, Ingredient, Recipe
+
+
+def get_ingredients(*ingredients):
+    return [
+        {'id': ingredient.id, 'amount': 100} for ingredient in ingredients
+    ]
+
+
+class SimilarRecipesTests(RecipeTestCase):
+    """Похожие рецепты по избранному и по набору ингредиентов."""
+
+    def setUp(self):
+        super().setUp()
+        self.extra = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(3, 7)
+        ]
+        self.soup = self.create_recipe()
+        self.missing = Recipe.objects.latest('id').id + 1
+
+    def get_ids(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data]
+
+    def test_similar(self):
+        salad, cake, stew = [self.create_recipe() for _ in range(3)]
+        for username, recipes in (
+            ('first', (self.soup, salad, cake)),
+            ('second', (self.soup, salad)),
+            ('third', (cake, stew)),
+        ):
+            user = create_user(username)
+            Favorite.objects.bulk_create(
+                Favorite(user=user, recipe=recipe) for recipe in recipes
+            )
+        url = f'/api/recipes/{self.soup.id}/similar/'
+        self.assertEqual(self.get_ids(url), [])
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(self.get_ids(url), [salad.id, cake.id])
+        response = get_client().get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_similar_by_ingredients(self):
+        ingredients = self.ingredients + self.extra
+        twin = self.create_recipe()
+        close = self.create_recipe(
+            ingredients=get_ingredients(*ingredients[:3])
+        )
+        other_tags = self.create_recipe(tags=[self.tags[2].id])
+        self.create_recipe(ingredients=get_ingredients(*ingredients[4:]))
+        url = f'/api/recipes/{self.soup.id}/similar_by_ingredients/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        similarity = {
+            recipe['id']: recipe['similarity'] for recipe in response.data
+        }
+        self.assertEqual(
+            list(similarity),
+            [other_tags.id, twin.id, close.id]
+        )
+        self.assertEqual(similarity[twin.id], 1.0)
+        self.assertLess(similarity[close.id], 1.0)
+        self.assertEqual(
+            self.get_ids(url, shared_tags='true'),
+            [twin.id, close.id]
+        )
+
+    def test_missing_recipe(self):
+        for url in ('similar', 'similar_by_ingredients'):
+            with self.subTest(url=url):
+                for pk in (self.missing, 'soup'):
+                    response = self.client.get(f'/api/recipes/{pk}/{url}/')
+                    self.assertEqual(response.status_code, 404)
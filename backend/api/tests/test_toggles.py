@@ -0,0 +1,128 @@
+from django.db.models import Sum
+
+from api.tests.base import RecipeTestCase, create_user, get_client
+from recipes.counters import recount_counters
+from recipes.models import (FeedItem, IngredientRecipe, Recipe,
+                            ShoppingListItem, User)
+from recipes.shopping_lists import find_drifted_users
+
+
+class ToggleTests(RecipeTestCase):
+    """
+    Избранное, корзина и подписка пишутся сырыми запросами без сигналов.
+
+    Побочные эффекты - счётчики, ленты, списки покупок и флаги
+    в выдаче - проверяются по базе после каждого переключения.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.reader = create_user('reader')
+        self.reader_client = get_client(self.reader)
+        self.recipe = self.create_recipe()
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def assertConsistent(self):
+        # Пересчёт с нуля не должен найти расхождений.
+        self.assertEqual(set(recount_counters().values()), {0})
+        self.assertEqual(find_drifted_users(), [])
+
+    def get_flags(self):
+        response = self.reader_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.data['is_favorited'], response.data[
+            'is_in_shopping_cart'
+        ]
+
+    def test_favorite(self):
+        self.assertEqual(self.get_flags(), (False, False))
+        response = self.reader_client.post(self.url + 'favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], self.recipe.id)
+        response = self.reader_client.post(self.url + 'favorite/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data)
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.popularity, 2)
+        self.assertEqual(self.get_flags(), (True, False))
+        self.assertConsistent()
+        response = self.reader_client.delete(self.url + 'favorite/')
+        self.assertEqual(response.status_code, 204)
+        response = self.reader_client.delete(self.url + 'favorite/')
+        self.assertEqual(response.status_code, 400)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(recipe.popularity, 0)
+        self.assertEqual(self.get_flags(), (False, False))
+        self.assertConsistent()
+
+    def test_shopping_cart(self):
+        response = self.reader_client.post(self.url + 'shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+        response = self.reader_client.post(self.url + 'shopping_cart/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_flags(), (False, True))
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.pk).popularity, 1)
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user=self.reader
+            ).values_list('ingredient_id', 'total_amount')),
+            dict(IngredientRecipe.objects.filter(
+                recipe=self.recipe
+            ).values('ingredient_id').annotate(
+                total=Sum('amount')
+            ).values_list('ingredient_id', 'total'))
+        )
+        self.assertConsistent()
+        response = self.reader_client.delete(self.url + 'shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        response = self.reader_client.delete(self.url + 'shopping_cart/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_flags(), (False, False))
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.reader).exists()
+        )
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.pk).popularity, 0)
+        self.assertConsistent()
+
+    def test_missing_recipe(self):
+        missing = Recipe.objects.latest('id').id + 1
+        response = self.reader_client.post(
+            f'/api/recipes/{missing}/favorite/'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.reader_client.delete(
+            f'/api/recipes/{missing}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertConsistent()
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        response = self.reader_client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_subscribed'])
+        response = self.reader_client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).subscribers_count, 1
+        )
+        self.assertEqual(
+            list(FeedItem.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', flat=True)),
+            [self.recipe.id]
+        )
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertConsistent()
+        response = self.reader_client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        response = self.reader_client.delete(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).subscribers_count, 0
+        )
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+        self.assertConsistent()
@@ -0,0 +1,76 @@
+from api.tests.base import RecipeTestCase, create_user, get_client
+from recipes.models import Favorite, ShoppingCart
+from recipes.user_recipes import load_user_recipe_ids
+
+URL = '/api/recipes/'
+BIG_ID = 2 ** 32 + 7
+
+
+class UserRecipeIdsTests(RecipeTestCase):
+    """Фильтры и флаги избранного и корзины читают id из кэша."""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = create_user('reader')
+        self.reader_client = get_client(self.reader)
+        self.soup = self.create_recipe()
+        self.salad = self.create_recipe()
+        # id больше 2 ** 32 не помещается в 4 байта.
+        self.big = self.create_recipe()
+        self.big.pk = BIG_ID
+        self.big._state.adding = True
+        self.big.save()
+        self.recipes = (self.soup, self.salad, self.big)
+
+    def toggle(self, method, url, recipe):
+        response = getattr(self.reader_client, method)(
+            f'{URL}{recipe.id}/{url}/'
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    def assertMatchesDatabase(self):
+        expected = {
+            'is_favorited': set(Favorite.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', flat=True)),
+            'is_in_shopping_cart': set(ShoppingCart.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', flat=True)),
+        }
+        response = self.reader_client.get(URL, {'limit': 10})
+        for field, ids in expected.items():
+            with self.subTest(field=field):
+                self.assertEqual(
+                    {
+                        recipe['id'] for recipe in response.data['results']
+                        if recipe[field]
+                    },
+                    ids
+                )
+                response_filtered = self.reader_client.get(
+                    URL, {field: 1, 'limit': 10}
+                )
+                self.assertEqual(
+                    {
+                        recipe['id']
+                        for recipe in response_filtered.data['results']
+                    },
+                    ids
+                )
+        self.assertEqual(
+            load_user_recipe_ids(self.reader.id),
+            (expected['is_favorited'], expected['is_in_shopping_cart'])
+        )
+
+    def test_toggles(self):
+        self.assertMatchesDatabase()
+        for recipe in self.recipes:
+            self.toggle('post', 'favorite', recipe)
+            self.assertMatchesDatabase()
+        self.toggle('post', 'shopping_cart', self.big)
+        self.toggle('post', 'shopping_cart', self.soup)
+        self.assertMatchesDatabase()
+        self.toggle('delete', 'favorite', self.salad)
+        self.assertMatchesDatabase()
+        self.toggle('delete', 'shopping_cart', self.big)
+        self.assertMatchesDatabase()
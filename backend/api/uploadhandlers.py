@@ -0,0 +1,50 @@
+import filetype
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from config import (RECIPE_IMAGE_MAX_SIZE, RECIPE_IMAGE_SIZE_MESSAGE,
+                    RECIPE_IMAGE_TYPE_MESSAGE, RECIPE_IMAGE_TYPES)
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'request_too_large'
+
+
+class RecipeImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет картинку из multipart-запроса во временный файл по частям.
+
+    Размер запроса проверяется по Content-Length до чтения тела, тип
+    картинки - по первой части файла, размер файла - по мере чтения,
+    так что неподходящий файл отклоняется, не дочитываясь до конца.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        max_length = (
+            RECIPE_IMAGE_MAX_SIZE + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        )
+        if content_length > max_length:
+            raise RequestTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0:
+            kind = filetype.guess(raw_data)
+            if kind is None or kind.mime not in RECIPE_IMAGE_TYPES:
+                self.reject(RECIPE_IMAGE_TYPE_MESSAGE)
+        self.size += len(raw_data)
+        if self.size > RECIPE_IMAGE_MAX_SIZE:
+            self.reject(RECIPE_IMAGE_SIZE_MESSAGE)
+        return super().receive_data_chunk(raw_data, start)
+
+    def reject(self, message):
+        self.file.close()
+        raise ValidationError({self.field_name: [message]})
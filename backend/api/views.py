@@ -1,29 +1,138 @@
-from django.db.models import Count, Exists, OuterRef, Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Value, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views as djoser_views
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.response import Response
 
 from api.filters import IngredientSetFilter, RecipeSetFilter
+from api.indexes import find_recipes_by_ingredients, get_ingredient_index
+from api.mixins import VersionedResponseCacheMixin
+from api.pagination import PageNumberLimitPagination, RecipeKeysetPagination
+from api.parsers import NDJSONParser
 from api.permissions import IsAuthorOrReadCreate
-from api.serializers import (FavoriteSerializer, IngredientSerializer,
-                             RecipeReadSerializer, RecipeWriteSerializer,
-                             ShoppingCartSerializer, SubscribeReadSerializer,
-                             SubscribeWriteSerializer, TagSerializer)
-from config import HTTP_METHODS, URL_DOWNLOAD_SHOPPING_CART
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Subscription, Tag, User)
+from api.renderers import (CSVShoppingCartRenderer, PDFShoppingCartRenderer,
+                           TextShoppingCartRenderer)
+from api.serializers import (BulkAuthorsSerializer, BulkRecipesSerializer,
+                             CookableRecipesSerializer, FavoriteSerializer,
+                             IngredientSerializer, RecipeReadSerializer,
+                             RecipeWriteSerializer, ShoppingCartSerializer,
+                             SimilarByIngredientsSerializer,
+                             SubscribeReadSerializer, SubscribeWriteSerializer,
+                             TagSerializer, get_recipes_limit)
+from api.uploadhandlers import RecipeImageUploadHandler
+from config import (FAVORITES_VERSION_KEY, HTTP_METHODS,
+                    INGREDIENT_SEARCH_LIMIT, INGREDIENTS_VERSION_KEY,
+                    MAX_PAGE_SIZE, RECIPE_IMPORT_MAX_ERRORS, RECIPE_ORDERINGS,
+                    RECIPES_VERSION_KEY, SHOPPING_CART_FILE_CACHE_KEY,
+                    SHOPPING_CART_FILE_CACHE_TIMEOUT, SHOPPING_CART_FILE_NAME,
+                    SHOPPING_CART_VERSION_KEY, TAGS_VERSION_KEY,
+                    URL_COOKABLE_RECIPES, URL_DOWNLOAD_SHOPPING_CART, URL_FEED,
+                    URL_IMPORT_RECIPES, URL_PROFILE_PREF,
+                    URL_RECOMMENDED_RECIPES, URL_SIMILAR_BY_INGREDIENTS,
+                    URL_SIMILAR_RECIPES)
+from recipes import bulk_import
+from recipes.counters import change_counter, change_popularity
+from recipes.feeds import (add_authors_to_feed, get_feed_page_ids,
+                           remove_authors_from_feed)
+from recipes.images import delete_image_variants, enqueue_image_variants
+from recipes.minhash import find_similar_recipes
+from recipes.models import (DataVersion, Favorite, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Subscription, Tag,
+                            User)
+from recipes.shopping_lists import (add_recipes_to_shopping_lists,
+                                    remove_recipes_from_shopping_lists,
+                                    subtract_recipes_from_shopping_list)
+from recipes.toggles import add_links, remove_link, remove_links
+
+
+def get_recipes_queryset(user):
+    """
+    Рецепты с автором и подпиской текущего пользователя на него.
+
+    Флаги избранного и корзины ставит RecipeReadSerializer по наборам
+    id пользователя из кэша.
+    """
+    queryset = Recipe.objects.select_related('author')
+    if user.is_authenticated:
+        author_is_subscribed = Subscription.objects.filter(
+            subscriber=user,
+            author=OuterRef('author')
+        )
+        return queryset.annotate(
+            author_is_subscribed=Exists(author_is_subscribed)
+        )
+    return queryset
+
+
+def get_bulk_ids(request, serializer_class):
+    """Список id из тела пакетного запроса, без повторов."""
+    serializer = serializer_class(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids, = serializer.validated_data.values()
+    return list(dict.fromkeys(ids))
+
+
+def get_bulk_response(ids, changed, success_status, get_error):
+    """Ответ пакетного действия: статус по каждому id в порядке запроса."""
+    return Response({'results': [
+        {'id': pk, 'status': success_status} if pk in changed else {
+            'id': pk,
+            'status': status.HTTP_400_BAD_REQUEST,
+            'error': get_error(pk),
+        }
+        for pk in ids
+    ]})
+
+
+def get_add_error(model, ids, added, exists_message):
+    """
+    Причина, по которой связь не добавилась: она уже была или объекта нет.
+
+    Существование объектов проверяется одним запросом и только для
+    тех id, что не добавились.
+    """
+    existing = set(model.objects.filter(
+        pk__in=[pk for pk in ids if pk not in added]
+    ).values_list('pk', flat=True))
+    does_not_exist = PrimaryKeyRelatedField.default_error_messages[
+        'does_not_exist'
+    ]
+    return lambda pk: (
+        exists_message if pk in existing
+        else does_not_exist.format(pk_value=pk)
+    )
 
 
 class FoodgramUserViewSet(djoser_views.UserViewSet):
 
-    queryset = User.objects.all().annotate(recipes_count=Count('recipes'))
+    queryset = User.objects.all()
     http_method_names = ('get', 'post', 'delete')
     filter_backends = (DjangoFilterBackend,)
+    cursor_ordering = ('username',)
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = super().get_queryset()
+        if user.is_authenticated:
+            return queryset.annotate(
+                is_subscribed=Exists(
+                    Subscription.objects.filter(
+                        subscriber=user,
+                        author=OuterRef('pk')
+                    )
+                )
+            )
+        return queryset
 
     def get_permissions(self):
         if self.action == 'me':
@@ -39,8 +148,12 @@ class FoodgramUserViewSet(djoser_views.UserViewSet):
     def get_subscriptions(self, request):
         authors = User.objects.filter(
             subscription_as_author__subscriber=request.user
-        ).annotate(recipes_count=Count('recipes'))
+        ).annotate(
+            is_subscribed=Value(True),
+        ).order_by(*self.cursor_ordering)
+        recipes_limit = get_recipes_limit(request)
         page = self.paginate_queryset(authors)
+        self.attach_latest_recipes(page, recipes_limit)
         serializer = SubscribeReadSerializer(
             page,
             context={'request': request},
@@ -48,6 +161,60 @@ class FoodgramUserViewSet(djoser_views.UserViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    @staticmethod
+    def attach_latest_recipes(authors, recipes_limit):
+        """
+        Выбирает последние рецепты всех авторов страницы одним запросом.
+
+        Ограничение числа рецептов на автора делается через ROW_NUMBER()
+        OVER (PARTITION BY author), что работает и в PostgreSQL, и в SQLite.
+        """
+        latest_recipes = {author.id: [] for author in authors}
+        recipes = Recipe.objects.filter(author__in=latest_recipes)
+        if recipes_limit is not None:
+            sql, params = recipes.annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('pub_date').desc(), F('id').desc()),
+                )
+            ).query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) AS ranked '
+                f'WHERE ranked.row_number <= %s '
+                f'ORDER BY ranked.row_number',
+                (*params, recipes_limit)
+            )
+        for recipe in recipes:
+            latest_recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = latest_recipes[author.id]
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        pagination_class=PageNumberLimitPagination,
+        url_path=f'{URL_PROFILE_PREF}/{URL_RECOMMENDED_RECIPES}'
+    )
+    def recommended(self, request):
+        """
+        Рецепты, похожие на избранное и корзину пользователя.
+
+        Список строит команда build_recommendations, страница читается
+        одним запросом по индексу (user, -score).
+        """
+        recipes = get_recipes_queryset(request.user).filter(
+            recommendations__user=request.user
+        ).order_by('-recommendations__score', '-id')
+        page = self.paginate_queryset(recipes)
+        serializer = RecipeReadSerializer(
+            page,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=('post',),
@@ -65,15 +232,65 @@ class FoodgramUserViewSet(djoser_views.UserViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @to_subscribe.mapping.delete
+    @transaction.atomic
     def to_unsubscribe(self, request, id=None):
-        subscription = Subscription.objects.filter(
-            subscriber=request.user,
-            author=id
+        if not remove_link(Subscription, subscriber=request.user, author=id):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        change_counter(User, 'subscribers_count', -1, pk=id)
+        remove_authors_from_feed(request.user.id, [id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=('post',),
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe',
+        url_name='subscribe-many'
+    )
+    @transaction.atomic
+    def subscribe_many(self, request):
+        """Подписывает на авторов из списка authors."""
+        ids = get_bulk_ids(request, BulkAuthorsSerializer)
+        added = add_links(
+            Subscription,
+            'author',
+            [pk for pk in ids if pk != request.user.id],
+            subscriber_id=request.user.id
+        )
+        change_counter(User, 'subscribers_count', 1, pk__in=added)
+        add_authors_to_feed(request.user.id, added)
+        get_error = get_add_error(
+            User, ids, added, 'Эта подписка уже существует.'
+        )
+        return get_bulk_response(
+            ids,
+            added,
+            status.HTTP_201_CREATED,
+            lambda pk: (
+                'Нельзя подписаться на самого себя!'
+                if pk == request.user.id else get_error(pk)
+            )
+        )
+
+    @subscribe_many.mapping.delete
+    @transaction.atomic
+    def unsubscribe_many(self, request):
+        """Отписывает от авторов из списка authors."""
+        ids = get_bulk_ids(request, BulkAuthorsSerializer)
+        removed = remove_links(
+            Subscription,
+            'author',
+            ids,
+            subscriber_id=request.user.id
+        )
+        change_counter(User, 'subscribers_count', -1, pk__in=removed)
+        remove_authors_from_feed(request.user.id, removed)
+        return get_bulk_response(
+            ids,
+            removed,
+            status.HTTP_204_NO_CONTENT,
+            lambda pk: 'Вы не подписаны на этого автора.'
         )
-        if subscription.exists():
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -82,66 +299,284 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthorOrReadCreate,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeSetFilter
+    lookup_value_regex = r'\d+'
+
+    @property
+    def cursor_ordering(self):
+        """Порядок курсорной пагинации с учётом ?ordering=."""
+        return RECIPE_ORDERINGS.get(
+            self.request.query_params.get('ordering'),
+            ('-pub_date', '-id')
+        )
 
     def get_serializer_class(self):
         if self.action == 'create' or self.action == 'partial_update':
             return RecipeWriteSerializer
         return RecipeReadSerializer
 
+    def initialize_request(self, request, *args, **kwargs):
+        request = super().initialize_request(request, *args, **kwargs)
+        if self.action in ('create', 'partial_update'):
+            request.upload_handlers = [RecipeImageUploadHandler(request)]
+        return request
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        remove_recipes_from_shopping_lists([instance.id])
+        instance.delete()
+        change_counter(User, 'recipes_count', -1, pk=instance.author_id)
+        variants = instance.image_variants
+        transaction.on_commit(lambda: delete_image_variants(variants))
+
     def get_queryset(self):
-        user = self.request.user
-        queryset = Recipe.objects.select_related(
-            'author'
-        ).prefetch_related(
-            'tags',
-            'ingredients'
-        )
-        if user.is_authenticated:
-            is_favorited = Favorite.objects.filter(
-                user=user,
-                recipe=OuterRef('pk')
+        return get_recipes_queryset(self.request.user)
+
+    def get_count_version_keys(self):
+        """
+        Версии данных, от которых зависит число рецептов в выдаче.
+
+        Версии избранного и корзины пользователя нужны только с их
+        фильтрами: выдача без них одна на всех. Поиск идёт и по названиям
+        ингредиентов.
+        """
+        keys = [RECIPES_VERSION_KEY, TAGS_VERSION_KEY]
+        params = self.request.query_params
+        if 'search' in params:
+            keys.append(INGREDIENTS_VERSION_KEY)
+        if 'is_favorited' in params:
+            keys.append(FAVORITES_VERSION_KEY.format(self.request.user.id))
+        if 'is_in_shopping_cart' in params:
+            keys.append(
+                SHOPPING_CART_VERSION_KEY.format(self.request.user.id)
             )
-            is_in_shopping_cart = ShoppingCart.objects.filter(
-                user=user,
-                recipe=OuterRef('pk')
+        return keys
+
+    @staticmethod
+    def get_recipe_id(pk):
+        """id рецепта из адреса или 404, если такого рецепта нет."""
+        return get_object_or_404(Recipe.objects.only('id'), pk=pk).id
+
+    @action(
+        detail=True,
+        methods=('get',),
+        pagination_class=None,
+        url_path=URL_SIMILAR_RECIPES
+    )
+    def similar(self, request, pk=None):
+        """
+        Рецепты, которые добавляют в избранное и корзину те же люди.
+
+        Список строит команда build_recommendations, здесь он читается
+        одним запросом по индексу (recipe, -score).
+        """
+        recipes = self.get_queryset().filter(
+            similar_to__recipe_id=self.get_recipe_id(pk)
+        ).order_by('-similar_to__score', '-id')
+        serializer = RecipeReadSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=('get',),
+        pagination_class=None,
+        url_path=URL_SIMILAR_BY_INGREDIENTS
+    )
+    def similar_by_ingredients(self, request, pk=None):
+        """
+        Рецепты с похожим набором ингредиентов.
+
+        Кандидатов дают корзины MinHash LSH, сравниваются только их
+        подписи. С ?shared_tags=true - только рецепты с общим тегом.
+        """
+        query = SimilarByIngredientsSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        similar = find_similar_recipes(
+            self.get_recipe_id(pk),
+            **query.validated_data
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in similar]
+        )
+        similar = [result for result in similar if result[0] in recipes]
+        representations = RecipeReadSerializer(
+            [recipes[recipe_id] for recipe_id, _ in similar],
+            many=True,
+            context=self.get_serializer_context()
+        ).data
+        return Response([
+            {**representation, 'similarity': round(similarity, 3)}
+            for representation, (_, similarity)
+            in zip(representations, similar)
+        ])
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        pagination_class=RecipeKeysetPagination,
+        url_path=URL_FEED
+    )
+    def feed(self, request):
+        """
+        Рецепты авторов, на которых подписан пользователь, новые первыми.
+
+        Страница - один запрос: id берутся из ленты пользователя и из
+        рецептов авторов с in_feeds=False, дальше страницы листаются
+        по курсору ?cursor=.
+        """
+        page = self.paginate_queryset(
+            lambda after, limit: self.get_queryset().filter(
+                id__in=get_feed_page_ids(request.user.id, after, limit)
+            ).order_by('-pub_date', '-id')
+        )
+        serializer = RecipeReadSerializer(
+            page,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=('get',),
+        pagination_class=PageNumberLimitPagination,
+        url_path=URL_COOKABLE_RECIPES
+    )
+    def cookable(self, request):
+        """
+        Рецепты по имеющимся ингредиентам: ?ingredients=1&ingredients=2.
+
+        Ищет по обратному индексу в памяти процесса, из базы читается
+        только страница рецептов. Фильтры - ?tags= и ?cooking_time=
+        (не дольше).
+        """
+        query = CookableRecipesSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        page = self.paginate_queryset(
+            find_recipes_by_ingredients(**query.validated_data)
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        page = [result for result in page if result[0] in recipes]
+        representations = RecipeReadSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page],
+            many=True,
+            context=self.get_serializer_context()
+        ).data
+        return self.get_paginated_response([
+            {
+                **representation,
+                'matched_ingredients': matched,
+                'missing_ingredients': missing,
+            }
+            for representation, (_, matched, missing)
+            in zip(representations, page)
+        ])
+
+    @action(
+        detail=False,
+        methods=('post',),
+        permission_classes=(IsAdminUser,),
+        parser_classes=(NDJSONParser,),
+        url_path=URL_IMPORT_RECIPES
+    )
+    def import_recipes(self, request):
+        """
+        Загружает рецепты из NDJSON, по рецепту в строке.
+
+        Картинки указываются путями в хранилище. Без поля author
+        автором становится текущий пользователь.
+        """
+        try:
+            recipes = bulk_import.import_recipes(
+                request.data,
+                default_author=request.user
             )
-            return queryset.annotate(
-                is_favorited=Exists(is_favorited)
-            ).annotate(
-                is_in_shopping_cart=Exists(is_in_shopping_cart)
+        except bulk_import.RecipeImportError as e:
+            return Response(
+                e.get_details(RECIPE_IMPORT_MAX_ERRORS),
+                status=status.HTTP_400_BAD_REQUEST
             )
-        return queryset
+        for recipe in recipes:
+            enqueue_image_variants(recipe)
+        return Response(
+            {'created': len(recipes)},
+            status=status.HTTP_201_CREATED
+        )
 
     @action(
         detail=False,
         methods=('get',),
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            TextShoppingCartRenderer,
+            CSVShoppingCartRenderer,
+            PDFShoppingCartRenderer,
+        ),
         url_path=URL_DOWNLOAD_SHOPPING_CART
     )
     def download_shopping_cart(self, request):
-        lines = []
-        lines.append('Список покупок:')
-        lines.append('')
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shoppingcarts__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('amount')
-        ).order_by(
-            'ingredient__name'
+        """
+        Отдаёт список покупок в формате ?format=txt|csv|pdf.
+
+        Готовый файл кэшируется по версии корзины пользователя.
+        """
+        renderer = request.accepted_renderer
+        key = SHOPPING_CART_FILE_CACHE_KEY.format(
+            user=request.user.id,
+            version=DataVersion.get_version(
+                SHOPPING_CART_VERSION_KEY.format(request.user.id)
+            ),
+            format=renderer.format,
         )
-        for item in ingredients:
-            lines.append(f'{item["ingredient__name"]} - {item["total_amount"]}'
-                         f'{item["ingredient__measurement_unit"]}')
-        content = '\n'.join(lines)
-        response = HttpResponse(content, content_type="text/plain")
+        content = cache.get(key)
+        if content is None and not renderer.streamed:
+            content = b''.join(
+                renderer.stream(self.get_shopping_cart_ingredients())
+            )
+            cache.set(key, content, SHOPPING_CART_FILE_CACHE_TIMEOUT)
+        if content is not None:
+            response = HttpResponse(
+                content,
+                content_type=renderer.get_content_type()
+            )
+        else:
+            response = StreamingHttpResponse(
+                self.stream_and_cache(
+                    renderer.stream(self.get_shopping_cart_ingredients()),
+                    key
+                ),
+                content_type=renderer.get_content_type()
+            )
         response['Content-Disposition'] = (
-            'attachment; filename=Shopping cart.txt'
+            f'attachment; filename={SHOPPING_CART_FILE_NAME}.{renderer.format}'
         )
         return response
 
+    def get_shopping_cart_ingredients(self):
+        return ShoppingListItem.objects.filter(
+            user=self.request.user
+        ).values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'total_amount',
+        ).order_by(
+            'ingredient__name'
+        ).iterator()
+
+    @staticmethod
+    def stream_and_cache(chunks, key):
+        content = []
+        for chunk in chunks:
+            content.append(chunk)
+            yield chunk
+        cache.set(key, b''.join(content), SHOPPING_CART_FILE_CACHE_TIMEOUT)
+
     @staticmethod
     def write_down_the_recipe(serializer_class, request, pk):
         data = {'user': request.user.id, 'recipe': pk}
@@ -160,12 +595,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.write_down_the_recipe(FavoriteSerializer, request, pk)
 
     @add_to_favorite.mapping.delete
+    @transaction.atomic
     def remove_from_favorite(self, request, pk=None):
-        favorite = Favorite.objects.filter(user=request.user, recipe=pk)
-        if favorite.exists():
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        if not remove_link(Favorite, user=request.user, recipe=pk):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        change_popularity(Favorite, -1, pk=pk)
+        DataVersion.bump(FAVORITES_VERSION_KEY.format(request.user.id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=True,
@@ -177,28 +613,137 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.write_down_the_recipe(ShoppingCartSerializer, request, pk)
 
     @add_to_shopping_cart.mapping.delete
+    @transaction.atomic
     def remove_from_shopping_cart(self, request, pk=None):
-        shopping_cart = ShoppingCart.objects.filter(
-            user=request.user,
-            recipe=pk
+        if not remove_link(ShoppingCart, user=request.user, recipe=pk):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        change_popularity(ShoppingCart, -1, pk=pk)
+        subtract_recipes_from_shopping_list([pk], request.user.id)
+        DataVersion.bump(SHOPPING_CART_VERSION_KEY.format(request.user.id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def add_many(model, request):
+        """Добавляет рецепты из списка recipes в избранное или корзину."""
+        ids = get_bulk_ids(request, BulkRecipesSerializer)
+        added = add_links(model, 'recipe', ids, user_id=request.user.id)
+        return ids, added, get_add_error(
+            Recipe, ids, added, f'Уже добавлен в {model._meta.verbose_name}'
         )
-        if shopping_cart.exists():
-            shopping_cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def remove_many(model, request):
+        """Убирает рецепты из списка recipes из избранного или корзины."""
+        ids = get_bulk_ids(request, BulkRecipesSerializer)
+        removed = remove_links(model, 'recipe', ids, user_id=request.user.id)
+        return ids, removed, (
+            lambda pk: f'Не добавлен в {model._meta.verbose_name}'
+        )
+
+    @action(
+        detail=False,
+        methods=('post',),
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite',
+        url_name='favorite-many'
+    )
+    @transaction.atomic
+    def add_many_to_favorite(self, request):
+        ids, added, get_error = self.add_many(Favorite, request)
+        if added:
+            change_popularity(Favorite, 1, pk__in=added)
+            DataVersion.bump(FAVORITES_VERSION_KEY.format(request.user.id))
+        return get_bulk_response(
+            ids, added, status.HTTP_201_CREATED, get_error
+        )
+
+    @add_many_to_favorite.mapping.delete
+    @transaction.atomic
+    def remove_many_from_favorite(self, request):
+        ids, removed, get_error = self.remove_many(Favorite, request)
+        if removed:
+            change_popularity(Favorite, -1, pk__in=removed)
+            DataVersion.bump(FAVORITES_VERSION_KEY.format(request.user.id))
+        return get_bulk_response(
+            ids, removed, status.HTTP_204_NO_CONTENT, get_error
+        )
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(
+        detail=False,
+        methods=('post',),
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart',
+        url_name='shopping_cart-many'
+    )
+    @transaction.atomic
+    def add_many_to_shopping_cart(self, request):
+        ids, added, get_error = self.add_many(ShoppingCart, request)
+        if added:
+            change_popularity(ShoppingCart, 1, pk__in=added)
+            add_recipes_to_shopping_lists(list(added), user_id=request.user.id)
+            DataVersion.bump(
+                SHOPPING_CART_VERSION_KEY.format(request.user.id)
+            )
+        return get_bulk_response(
+            ids, added, status.HTTP_201_CREATED, get_error
+        )
+
+    @add_many_to_shopping_cart.mapping.delete
+    @transaction.atomic
+    def remove_many_from_shopping_cart(self, request):
+        ids, removed, get_error = self.remove_many(ShoppingCart, request)
+        if removed:
+            change_popularity(ShoppingCart, -1, pk__in=removed)
+            subtract_recipes_from_shopping_list(
+                list(removed),
+                request.user.id
+            )
+            DataVersion.bump(
+                SHOPPING_CART_VERSION_KEY.format(request.user.id)
+            )
+        return get_bulk_response(
+            ids, removed, status.HTTP_204_NO_CONTENT, get_error
+        )
+
+
+class TagViewSet(VersionedResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
+    version_key = TAGS_VERSION_KEY
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    VersionedResponseCacheMixin,
+    viewsets.ReadOnlyModelViewSet
+):
+    version_key = INGREDIENTS_VERSION_KEY
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     pagination_class = None
     filterset_class = IngredientSetFilter
+
+    def list(self, request, *args, **kwargs):
+        if 'name' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.get_versioned_response(request, self.search_by_name)
+
+    def search_by_name(self, request):
+        """Отвечает на ?name= из индекса по началу названия."""
+        name = request.query_params['name']
+        try:
+            limit = int(
+                request.query_params.get('limit', INGREDIENT_SEARCH_LIMIT)
+            )
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError(
+                {'limit': 'Лимит должен быть целым положительным числом.'}
+            )
+        return Response(
+            get_ingredient_index().search(name, min(limit, MAX_PAGE_SIZE))
+        )
@@ -16,3 +16,88 @@ AMOUNT_MIN_VALUE = 1
 SLICE_STR_METHOD_LIMIT = 20
 HTTP_METHODS = ('get', 'post', 'patch', 'delete')
 URL_DOWNLOAD_SHOPPING_CART = 'download_shopping_cart'
+URL_IMPORT_RECIPES = 'import'
+URL_COOKABLE_RECIPES = 'cookable'
+URL_FEED = 'feed'
+URL_SIMILAR_RECIPES = 'similar'
+URL_RECOMMENDED_RECIPES = 'recommended'
+URL_SIMILAR_BY_INGREDIENTS = 'similar_by_ingredients'
+COOKABLE_MAX_INGREDIENTS = 100
+BULK_ACTION_MAX_ITEMS = 100
+MAX_PAGE_SIZE = 100
+PAGE_COUNT_CACHE_TIMEOUT = 60
+PAGE_COUNT_CACHE_KEY = 'page_count:{}'
+CURSOR_QUERY_PARAM = 'cursor'
+RECIPE_CACHE_KEY = 'recipe:{id}:{version}:{host}'
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+INGREDIENTS_VERSION_KEY = 'ingredients'
+INGREDIENT_SEARCH_LIMIT = 50
+TAGS_VERSION_KEY = 'tags'
+TAG_INDEX_MAX_AGE = 60
+RECIPES_VERSION_KEY = 'recipes'
+RECIPE_INDEX_MAX_CHANGES = 500
+RENDERED_RESPONSES_MAX_ENTRIES = 1000
+SHOPPING_CART_VERSION_KEY = 'shopping_cart:{}'
+FAVORITES_VERSION_KEY = 'favorites:{}'
+USER_RECIPE_IDS_CACHE_KEY = 'user_recipe_ids:{typecode}:{key}:{version}'
+USER_RECIPE_IDS_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_CART_FILE_CACHE_KEY = 'shopping_cart_file:{user}:{version}:{format}'
+SHOPPING_CART_FILE_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_CART_FILE_NAME = 'Shopping cart'
+SHOPPING_CART_TITLE = 'Список покупок'
+SHOPPING_CART_PDF_FONT = 'ShoppingCartFont'
+SHOPPING_LIST_BATCH_SIZE = 1000
+FEED_MAX_ITEMS = 500
+POPULARITY_FAVORITE_WEIGHT = 2
+POPULARITY_SHOPPING_CART_WEIGHT = 1
+TRENDING_DECAY_FACTOR = 0.5 ** (1 / 24)
+TRENDING_MIN_SCORE = 0.01
+RECOMMENDATION_NEIGHBOURS = 20
+RECOMMENDATIONS_PER_USER = 100
+RECOMMENDATION_FAVORITE_WEIGHT = 1.0
+RECOMMENDATION_SHOPPING_CART_WEIGHT = 0.5
+RECOMMENDATION_BATCH_SIZE = 2000
+RECOMMENDATION_WRITE_BATCH_SIZE = 5000
+# 16 полос по 4 значения: порог LSH около 0.5 по Жаккару, рецепты
+# с близостью от 0.7 попадают в общую корзину с вероятностью 99%.
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+MINHASH_SEED = 20240501
+MINHASH_MAX_CANDIDATES = 200
+MINHASH_SIMILAR_RECIPES = 20
+MINHASH_BATCH_SIZE = 5000
+RECIPE_ORDERINGS = {
+    'popular': ('-popularity', '-pub_date', '-id'),
+    'trending': ('-trending_score', '-pub_date', '-id'),
+}
+FEED_FANOUT_MAX_SUBSCRIBERS = 1000
+IMPORT_CSV_BATCH_SIZE = 5000
+IMPORT_CSV_MAX_ERRORS = 20
+IMPORT_CSV_PROGRESS_ROWS = 100000
+RECIPE_IMPORT_BATCH_SIZE = 1000
+RECIPE_IMPORT_MAX_ERRORS = 50
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 240),
+    'card': (640, 480),
+    'full': (1280, 960),
+}
+IMAGE_VARIANTS_FITTED = ('thumbnail', 'card')
+IMAGE_VARIANT_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+IMAGE_VARIANT_QUALITY = 82
+IMAGE_VARIANTS_PATH = 'recipes/images/variants/'
+IMAGE_WORKERS = 2
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+RECIPE_IMAGE_TYPE_MESSAGE = (
+    'Картинка должна быть в формате JPEG, PNG, GIF или WebP.'
+)
+RECIPE_IMAGE_SIZE_MESSAGE = (
+    f'Картинка не должна быть больше {RECIPE_IMAGE_MAX_SIZE >> 20} Мб.'
+)
+DATA_VERSION_KEY_LENGTH = 100
+USER_REPRESENTATION_FIELDS = ('email', 'username', 'first_name', 'last_name')
+RECIPE_SEARCH_CONFIG = 'russian'
+RECIPE_SEARCH_FTS_WEIGHTS = (10.0, 4.0, 1.0)
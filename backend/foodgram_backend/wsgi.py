@@ -10,7 +10,15 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
 application = get_wsgi_application()
+
+from api.indexes import get_ingredient_index  # noqa: E402
+
+try:
+    get_ingredient_index()
+except DatabaseError:
+    pass
@@ -1,11 +1,24 @@
+from collections import Counter
+from functools import partial
+
 from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.utils.safestring import mark_safe
 
+from .counters import change_counter, change_popularity
+from .feeds import (add_authors_to_feed, fan_out_recipes,
+                    remove_authors_from_feed)
+from .images import delete_image_variants
+from .minhash import update_signatures
 from .models import (Favorite, Ingredient, Recipe, ShoppingCart, Subscription,
                      Tag, User)
+from .search import update_search_index
+from .shopping_lists import (add_recipes_to_shopping_lists,
+                             remove_recipes_from_shopping_lists)
 
 admin.site.unregister(Group)
 
@@ -28,14 +41,6 @@ class UserAdmin(BaseUserAdmin):
         'username',
     )
 
-    @admin.display(description='Кол-во рецептов')
-    def recipes_count(self, obj):
-        return obj.recipes.count()
-
-    @admin.display(description='Кол-во подписчиков')
-    def subscribers_count(self, obj):
-        return obj.subscription_as_author.count()
-
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -99,16 +104,55 @@ class RecipeAdmin(admin.ModelAdmin):
         'tags',
     )
 
+    def save_model(self, request, obj, form, change):
+        old_author_id = None
+        if change and 'author' in form.changed_data:
+            old_author_id = form.initial['author']
+        super().save_model(request, obj, form, change)
+        if not change:
+            change_counter(User, 'recipes_count', 1, pk=obj.author_id)
+        elif old_author_id is not None:
+            change_counter(User, 'recipes_count', -1, pk=old_author_id)
+            change_counter(User, 'recipes_count', 1, pk=obj.author_id)
+
+    def save_related(self, request, form, formsets, change):
+        if change:
+            remove_recipes_from_shopping_lists([form.instance.id])
+        super().save_related(request, form, formsets, change)
+        if change:
+            add_recipes_to_shopping_lists([form.instance.id])
+        update_search_index([form.instance.id])
+        update_signatures([form.instance.id])
+        if not change:
+            fan_out_recipes([form.instance.id])
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Recipe.objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        """Удаляет рецепты так же, как API: со списками и счётчиками."""
+        recipes = list(queryset.values_list(
+            'id', 'author_id', 'image_variants', named=True
+        ))
+        remove_recipes_from_shopping_lists([recipe.id for recipe in recipes])
+        queryset.delete()
+        authors = Counter(recipe.author_id for recipe in recipes)
+        for author_id, count in authors.items():
+            change_counter(User, 'recipes_count', -count, pk=author_id)
+        for recipe in recipes:
+            transaction.on_commit(
+                partial(delete_image_variants, recipe.image_variants)
+            )
+
     @admin.display(description='Картинка')
     def show_image(self, obj):
+        thumbnail = obj.image_variants.get('thumbnail', {}).get('jpeg')
+        url = default_storage.url(thumbnail) if thumbnail else obj.image.url
         return mark_safe(
-            f'<img src={obj.image.url} width="80" height="60">'
+            f'<img src={url} width="80" height="60">'
         )
 
-    @admin.display(description='В избранном, раз')
-    def favorites_count(self, obj):
-        return obj.favorites.count()
-
     @admin.display(description='Ингредиенты')
     def ingredients_list(self, obj):
         return list(item.name for item in obj.ingredients.all())
@@ -118,25 +162,85 @@ class RecipeAdmin(admin.ModelAdmin):
         return list(item.name for item in obj.tags.all())
 
 
+class LinkAdmin(admin.ModelAdmin):
+    """
+    Админка связей - подписок, избранного и корзин.
+
+    Связи пишутся через ORM, а счётчики и производные данные
+    обновляются теми же функциями, что и в API: link_removed
+    до удаления связи, link_added после записи. Изменение связи
+    считается удалением старой и добавлением новой.
+    """
+
+    def link_added(self, link):
+        """Обновляет производные данные после записи связи."""
+
+    def link_removed(self, link):
+        """Обновляет производные данные перед удалением связи."""
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        changed = not change or bool(form.changed_data)
+        if change and changed:
+            self.link_removed(type(obj).objects.get(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        if changed:
+            self.link_added(obj)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, type(obj).objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for link in queryset:
+            self.link_removed(link)
+        queryset.delete()
+
+
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LinkAdmin):
     list_display = (
         'subscriber',
         'author',
     )
 
+    def link_added(self, link):
+        change_counter(User, 'subscribers_count', 1, pk=link.author_id)
+        add_authors_to_feed(link.subscriber_id, [link.author_id])
+
+    def link_removed(self, link):
+        change_counter(User, 'subscribers_count', -1, pk=link.author_id)
+        remove_authors_from_feed(link.subscriber_id, [link.author_id])
+
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LinkAdmin):
     list_display = (
         'user',
         'recipe',
     )
 
+    def link_added(self, link):
+        change_popularity(ShoppingCart, 1, pk=link.recipe_id)
+        add_recipes_to_shopping_lists([link.recipe_id], user_id=link.user_id)
+
+    def link_removed(self, link):
+        change_popularity(ShoppingCart, -1, pk=link.recipe_id)
+        remove_recipes_from_shopping_lists(
+            [link.recipe_id],
+            user_id=link.user_id
+        )
+
 
 @admin.register(Favorite)
-class FavoriteRecipeAdmin(admin.ModelAdmin):
+class FavoriteRecipeAdmin(LinkAdmin):
     list_display = (
         'user',
         'recipe',
     )
+
+    def link_added(self, link):
+        change_popularity(Favorite, 1, pk=link.recipe_id)
+
+    def link_removed(self, link):
+        change_popularity(Favorite, -1, pk=link.recipe_id)
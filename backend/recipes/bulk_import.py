@@ -0,0 +1,320 @@
+import json
+import os
+from collections import Counter
+
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Max, Q
+
+from config import RECIPE_IMPORT_BATCH_SIZE
+from recipes.counters import change_counter
+from recipes.feeds import fan_out_recipes
+from recipes.minhash import update_signatures
+from recipes.models import (Ingredient, IngredientRecipe, Recipe, RecipeChange,
+                            Tag, User)
+from recipes.search import update_search_index
+
+RECIPE_FIELDS = ('name', 'text', 'cooking_time')
+AMOUNT_FIELD = IngredientRecipe._meta.get_field('amount')
+IMAGE_FIELD = Recipe._meta.get_field('image')
+RecipeTag = Recipe.tags.through
+
+
+class RecipeImportError(ValueError):
+    """Ошибки в загружаемых рецептах: список пар (номер строки, текст)."""
+
+    def __init__(self, errors):
+        super().__init__(f'Ошибок в рецептах: {len(errors)}')
+        self.errors = errors
+
+    def get_details(self, limit):
+        return {
+            'errors_count': len(self.errors),
+            'errors': [
+                {'line': number, 'error': error}
+                for number, error in self.errors[:limit]
+            ],
+        }
+
+
+def read_ndjson(lines):
+    """Разбирает NDJSON в список пар (номер строки, рецепт)."""
+    records = []
+    errors = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            errors.append((number, f'Некорректный JSON: {e}'))
+            continue
+        if not isinstance(record, dict):
+            errors.append((number, 'Рецепт должен быть JSON-объектом.'))
+            continue
+        records.append((number, record))
+    if errors:
+        raise RecipeImportError(errors)
+    return records
+
+
+class RecipeValidator:
+    """
+    Проверяет рецепты до записи.
+
+    Авторы, теги и ингредиенты всех рецептов ищутся заранее, по одному
+    запросу на модель, поэтому проверка не ходит в базу на каждый
+    рецепт.
+    """
+
+    def __init__(self, records, default_author=None, images_dir=None):
+        self.default_author = default_author
+        self.images_dir = images_dir
+        usernames = set()
+        tag_ids, tag_slugs = set(), set()
+        ingredient_ids, ingredient_names = set(), set()
+        for _, record in records:
+            if isinstance(record.get('author'), str):
+                usernames.add(record['author'])
+            for tag in self.get_list(record, 'tags'):
+                if isinstance(tag, int):
+                    tag_ids.add(tag)
+                elif isinstance(tag, str):
+                    tag_slugs.add(tag)
+            for ingredient in self.get_list(record, 'ingredients'):
+                if not isinstance(ingredient, dict):
+                    continue
+                if isinstance(ingredient.get('id'), int):
+                    ingredient_ids.add(ingredient['id'])
+                elif isinstance(ingredient.get('name'), str):
+                    ingredient_names.add(ingredient['name'])
+        self.authors = dict(
+            User.objects.filter(
+                username__in=usernames
+            ).values_list('username', 'id')
+        )
+        self.tags = {}
+        for tag_id, slug in Tag.objects.filter(
+            Q(id__in=tag_ids) | Q(slug__in=tag_slugs)
+        ).values_list('id', 'slug'):
+            self.tags[tag_id] = self.tags[slug] = tag_id
+        self.ingredients = {}
+        for ingredient_id, name, measurement_unit in Ingredient.objects.filter(
+            Q(id__in=ingredient_ids) | Q(name__in=ingredient_names)
+        ).values_list('id', 'name', 'measurement_unit'):
+            self.ingredients[ingredient_id] = ingredient_id
+            self.ingredients[(name, measurement_unit)] = ingredient_id
+
+    @staticmethod
+    def get_list(record, key):
+        value = record.get(key)
+        return value if isinstance(value, list) else []
+
+    def validate(self, records):
+        """Возвращает подготовленные рецепты или бросает RecipeImportError."""
+        recipes = []
+        errors = []
+        for number, record in records:
+            record_errors = []
+            recipes.append(self.validate_record(record, record_errors))
+            errors.extend((number, error) for error in record_errors)
+        if errors:
+            raise RecipeImportError(errors)
+        return recipes
+
+    def validate_record(self, record, errors):
+        values = {}
+        for name in RECIPE_FIELDS:
+            try:
+                values[name] = Recipe._meta.get_field(name).clean(
+                    record.get(name), None
+                )
+            except ValidationError as e:
+                errors.append(f'{name}: {"; ".join(e.messages)}')
+        image_path = self.validate_image(record, values, errors)
+        return {
+            'recipe': Recipe(
+                author_id=self.validate_author(record, errors),
+                **values
+            ),
+            'image_path': image_path,
+            'tags': self.validate_tags(record, errors),
+            'ingredients': self.validate_ingredients(record, errors),
+        }
+
+    def validate_author(self, record, errors):
+        if 'author' not in record and self.default_author is not None:
+            return self.default_author.id
+        author_id = self.authors.get(record.get('author'))
+        if author_id is None:
+            errors.append(f'author: нет пользователя {record.get("author")}.')
+        return author_id
+
+    def validate_image(self, record, values, errors):
+        """
+        Картинка - путь в хранилище или файл в images_dir.
+
+        Путь в хранилище сразу записывается в values, для файла
+        возвращается его путь, чтобы скопировать его при записи.
+        """
+        image = record.get('image')
+        if not isinstance(image, str) or not image:
+            errors.append('image: обязательное поле.')
+            return None
+        try:
+            if default_storage.exists(image):
+                values['image'] = image
+                return None
+        except SuspiciousFileOperation:
+            pass
+        if self.images_dir:
+            path = os.path.join(self.images_dir, image)
+            if os.path.isfile(path):
+                return path
+        errors.append(f'image: файл {image} не найден.')
+        return None
+
+    def validate_tags(self, record, errors):
+        tags = self.get_list(record, 'tags')
+        if not tags:
+            errors.append('tags: поле не может быть пустым.')
+            return []
+        tag_ids = []
+        for tag in tags:
+            tag_id = None
+            if isinstance(tag, (int, str)):
+                tag_id = self.tags.get(tag)
+            if tag_id is None:
+                errors.append(f'tags: нет тега {tag}.')
+            tag_ids.append(tag_id)
+        if len(set(tag_ids)) < len(tag_ids):
+            errors.append('tags: один из тегов передан дважды.')
+        return tag_ids
+
+    def validate_ingredients(self, record, errors):
+        ingredients = self.get_list(record, 'ingredients')
+        if not ingredients:
+            errors.append('ingredients: поле не может быть пустым.')
+            return []
+        amounts = {}
+        for ingredient in ingredients:
+            if not isinstance(ingredient, dict):
+                errors.append('ingredients: ингредиент должен быть объектом.')
+                continue
+            key = ingredient.get('id')
+            if not isinstance(key, int):
+                key = (
+                    str(ingredient.get('name')),
+                    str(ingredient.get('measurement_unit')),
+                )
+            ingredient_id = self.ingredients.get(key)
+            if ingredient_id is None:
+                errors.append(f'ingredients: нет ингредиента {key}.')
+                continue
+            if ingredient_id in amounts:
+                errors.append('ingredients: один из ингредиентов передан '
+                              'дважды.')
+            try:
+                amounts[ingredient_id] = AMOUNT_FIELD.clean(
+                    ingredient.get('amount'), None
+                )
+            except ValidationError as e:
+                errors.append(f'amount: {"; ".join(e.messages)}')
+        return list(amounts.items())
+
+
+def get_next_sqlite_recipe_id():
+    """
+    Первый id, который SQLite ещё не выдавал рецептам.
+
+    Таблица создана с AUTOINCREMENT: sqlite_sequence помнит наибольший
+    выданный id, в том числе удалённых рецептов, по которым в кэше,
+    поиске и лентах могли остаться записи. Вставка с явными id сама
+    сдвигает sqlite_sequence.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT seq FROM sqlite_sequence WHERE name = %s',
+            [Recipe._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return max(
+        row[0] if row else 0,
+        Recipe.objects.aggregate(Max('id'))['id__max'] or 0
+    ) + 1
+
+
+def save_recipes(recipes, saved_images):
+    """
+    Записывает подготовленные рецепты пачками.
+
+    На пачку приходится по одному bulk_create для рецептов, ингредиентов
+    и тегов. SQLite не возвращает первичные ключи из bulk_create, поэтому
+    для него ключи назначаются заранее, внутри транзакции.
+    """
+    next_id = None
+    if not connection.features.can_return_rows_from_bulk_insert:
+        next_id = get_next_sqlite_recipe_id()
+    for start in range(0, len(recipes), RECIPE_IMPORT_BATCH_SIZE):
+        batch = recipes[start:start + RECIPE_IMPORT_BATCH_SIZE]
+        for item in batch:
+            recipe = item['recipe']
+            if item['image_path']:
+                with open(item['image_path'], 'rb') as image_file:
+                    recipe.image = default_storage.save(
+                        IMAGE_FIELD.generate_filename(
+                            recipe,
+                            os.path.basename(item['image_path'])
+                        ),
+                        File(image_file)
+                    )
+                saved_images.append(recipe.image.name)
+            if next_id is not None:
+                recipe.id = next_id
+                next_id += 1
+            # bulk_create не вызывает recipe_pre_save.
+            recipe.cache_version = 1
+        Recipe.objects.bulk_create(item['recipe'] for item in batch)
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe_id=item['recipe'].id,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for item in batch
+            for ingredient_id, amount in item['ingredients']
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe_id=item['recipe'].id, tag_id=tag_id)
+            for item in batch
+            for tag_id in item['tags']
+        )
+        update_search_index([item['recipe'].id for item in batch])
+        update_signatures([item['recipe'].id for item in batch])
+        fan_out_recipes([item['recipe'].id for item in batch])
+    authors = Counter(item['recipe'].author_id for item in recipes)
+    for author_id, count in authors.items():
+        change_counter(User, 'recipes_count', count, pk=author_id)
+    RecipeChange.log(item['recipe'].id for item in recipes)
+
+
+def import_recipes(records, default_author=None, images_dir=None):
+    """
+    Проверяет и загружает рецепты, разобранные read_ndjson.
+
+    Если хотя бы один рецепт с ошибкой, ничего не записывается.
+    Возвращает созданные рецепты.
+    """
+    validator = RecipeValidator(records, default_author, images_dir)
+    recipes = validator.validate(records)
+    saved_images = []
+    try:
+        with transaction.atomic():
+            save_recipes(recipes, saved_images)
+    except Exception:
+        for name in saved_images:
+            default_storage.delete(name)
+        raise
+    return [item['recipe'] for item in recipes]
@@ -0,0 +1,105 @@
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce, Greatest
+
+from config import (POPULARITY_FAVORITE_WEIGHT,
+                    POPULARITY_SHOPPING_CART_WEIGHT, TRENDING_MIN_SCORE)
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscription, User
+
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+)
+POPULARITY_WEIGHTS = {
+    Favorite: POPULARITY_FAVORITE_WEIGHT,
+    ShoppingCart: POPULARITY_SHOPPING_CART_WEIGHT,
+}
+
+
+def change_counter(model, field, delta, **filters):
+    """Атомарно меняет счётчик, не опуская его ниже нуля."""
+    if delta < 0:
+        filters[f'{field}__gte'] = -delta
+    return model.objects.filter(**filters).update(**{field: F(field) + delta})
+
+
+def change_popularity(model, delta, **filters):
+    """
+    Меняет популярность рецептов после добавления (delta > 0) или
+    удаления delta связей model - избранного или корзины.
+
+    Популярность, трендовость и счётчик избранного меняются одним
+    UPDATE и не опускаются ниже нуля. Трендовость со временем гасит
+    команда decay_trending, поэтому удаление старой связи может снять
+    больше, чем она добавила, и тогда трендовость упирается в ноль.
+    """
+    weight = POPULARITY_WEIGHTS[model] * delta
+    values = {
+        'popularity': Greatest(F('popularity') + weight, 0),
+        'trending_score': Greatest(F('trending_score') + weight, 0.0),
+    }
+    if model is Favorite:
+        values['favorites_count'] = Greatest(F('favorites_count') + delta, 0)
+    return Recipe.objects.filter(**filters).update(**values)
+
+
+def decay_trending(factor):
+    """
+    Умножает трендовость всех рецептов на factor одним UPDATE.
+
+    Значения меньше TRENDING_MIN_SCORE обнуляются, чтобы рецепты
+    без свежей активности не оставались в выборке следующих проходов.
+    Возвращает число изменённых рецептов.
+    """
+    return Recipe.objects.filter(trending_score__gt=0).update(
+        trending_score=Case(
+            When(
+                trending_score__lt=TRENDING_MIN_SCORE / factor,
+                then=0.0
+            ),
+            default=F('trending_score') * factor,
+        )
+    )
+
+
+def get_actual_count(related_model, related_field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(
+                related_field
+            ).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+def recount_counters():
+    """Исправляет разошедшиеся счётчики и возвращает число исправлений."""
+    fixed = {}
+    for model, field, related_model, related_field in COUNTERS:
+        actual_count = get_actual_count(related_model, related_field)
+        drifted = model.objects.annotate(
+            actual_count=actual_count
+        ).exclude(
+            **{field: F('actual_count')}
+        ).values_list('pk', flat=True)
+        fixed[f'{model.__name__}.{field}'] = model.objects.filter(
+            pk__in=list(drifted)
+        ).update(**{field: actual_count})
+    actual_popularity = sum(
+        weight * get_actual_count(related_model, 'recipe')
+        for related_model, weight in POPULARITY_WEIGHTS.items()
+    )
+    drifted = Recipe.objects.annotate(
+        actual_popularity=actual_popularity
+    ).exclude(
+        popularity=F('actual_popularity')
+    ).values_list('pk', flat=True)
+    fixed['Recipe.popularity'] = Recipe.objects.filter(
+        pk__in=list(drifted)
+    ).update(popularity=actual_popularity)
+    return fixed
@@ -0,0 +1,198 @@
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from config import FEED_FANOUT_MAX_SUBSCRIBERS, FEED_MAX_ITEMS
+from recipes.models import FeedItem, Recipe, Subscription, User
+
+FEED_TABLE = connection.ops.quote_name(FeedItem._meta.db_table)
+RECIPE_TABLE = connection.ops.quote_name(Recipe._meta.db_table)
+SUBSCRIPTION_TABLE = connection.ops.quote_name(Subscription._meta.db_table)
+USER_TABLE = connection.ops.quote_name(User._meta.db_table)
+
+
+def get_ids_sql(ids):
+    return ', '.join(['%s'] * len(ids)), list(ids)
+
+
+def trim_feeds(users_sql, params):
+    """Оставляет в лентах пользователей FEED_MAX_ITEMS новых записей."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            DELETE FROM {FEED_TABLE} WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY user_id
+                        ORDER BY pub_date DESC, recipe_id DESC
+                    ) AS position
+                    FROM {FEED_TABLE}
+                    WHERE user_id IN ({users_sql})
+                ) AS ranked
+                WHERE ranked.position > %s
+            )
+            ''',
+            [*params, FEED_MAX_ITEMS]
+        )
+
+
+def fan_out_recipes(recipe_ids):
+    """
+    Раскладывает новые рецепты по лентам подписчиков их авторов.
+
+    Рецепты авторов, у которых больше FEED_FANOUT_MAX_SUBSCRIBERS
+    подписчиков, в ленты не пишутся и помечаются in_feeds=False:
+    их подмешивает чтение ленты.
+    """
+    if not recipe_ids:
+        return
+    ids_sql, params = get_ids_sql(recipe_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            UPDATE {RECIPE_TABLE} SET in_feeds = %s
+            WHERE id IN ({ids_sql}) AND author_id IN (
+                SELECT id FROM {USER_TABLE} WHERE subscribers_count > %s
+            )
+            ''',
+            [False, *params, FEED_FANOUT_MAX_SUBSCRIBERS]
+        )
+        cursor.execute(
+            f'''
+            INSERT INTO {FEED_TABLE} (user_id, author_id, recipe_id, pub_date)
+            SELECT subscription.subscriber_id, recipe.author_id, recipe.id,
+                recipe.pub_date
+            FROM {RECIPE_TABLE} AS recipe
+            INNER JOIN {SUBSCRIPTION_TABLE} AS subscription
+                ON subscription.author_id = recipe.author_id
+            WHERE recipe.id IN ({ids_sql}) AND recipe.in_feeds
+            ON CONFLICT (user_id, recipe_id) DO NOTHING
+            ''',
+            params
+        )
+    trim_feeds(
+        f'''
+        SELECT subscription.subscriber_id
+        FROM {SUBSCRIPTION_TABLE} AS subscription
+        INNER JOIN {RECIPE_TABLE} AS recipe
+            ON recipe.author_id = subscription.author_id
+        WHERE recipe.id IN ({ids_sql}) AND recipe.in_feeds
+        ''',
+        params
+    )
+
+
+def add_authors_to_feed(user_id, author_ids):
+    """Дописывает в ленту последние рецепты новых авторов подписки."""
+    if not author_ids:
+        return
+    ids_sql, params = get_ids_sql(author_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {FEED_TABLE} (user_id, author_id, recipe_id, pub_date)
+            SELECT %s, latest.author_id, latest.id, latest.pub_date FROM (
+                SELECT author_id, id, pub_date FROM {RECIPE_TABLE}
+                WHERE author_id IN ({ids_sql}) AND in_feeds
+                ORDER BY pub_date DESC, id DESC
+                LIMIT %s
+            ) AS latest
+            WHERE 1 = 1
+            ON CONFLICT (user_id, recipe_id) DO NOTHING
+            ''',
+            [user_id, *params, FEED_MAX_ITEMS]
+        )
+    trim_feeds('%s', [user_id])
+
+
+def remove_authors_from_feed(user_id, author_ids):
+    """Убирает из ленты рецепты авторов, от которых пользователь отписался."""
+    if not author_ids:
+        return
+    FeedItem.objects.filter(
+        user_id=user_id,
+        author_id__in=author_ids
+    )._raw_delete(FeedItem.objects.db)
+
+
+def rebuild_feeds():
+    """
+    Заново раскладывает рецепты по лентам всех подписчиков.
+
+    Рецепты авторов, у которых сейчас больше FEED_FANOUT_MAX_SUBSCRIBERS
+    подписчиков, помечаются in_feeds=False.
+    """
+    FeedItem.objects.all()._raw_delete(FeedItem.objects.db)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            UPDATE {RECIPE_TABLE} SET in_feeds = author_id NOT IN (
+                SELECT id FROM {USER_TABLE} WHERE subscribers_count > %s
+            )
+            ''',
+            [FEED_FANOUT_MAX_SUBSCRIBERS]
+        )
+        cursor.execute(
+            f'''
+            INSERT INTO {FEED_TABLE} (user_id, author_id, recipe_id, pub_date)
+            SELECT subscriber_id, author_id, id, pub_date FROM (
+                SELECT subscription.subscriber_id, recipe.author_id,
+                    recipe.id, recipe.pub_date,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY subscription.subscriber_id
+                        ORDER BY recipe.pub_date DESC, recipe.id DESC
+                    ) AS position
+                FROM {RECIPE_TABLE} AS recipe
+                INNER JOIN {SUBSCRIPTION_TABLE} AS subscription
+                    ON subscription.author_id = recipe.author_id
+                WHERE recipe.in_feeds
+            ) AS ranked
+            WHERE ranked.position <= %s
+            ''',
+            [FEED_MAX_ITEMS]
+        )
+
+
+def get_feed_page_ids(user_id, after, limit):
+    """
+    Id рецептов страницы ленты, после рецепта after = (pub_date, id).
+
+    Записи ленты и рецепты авторов с in_feeds=False выбираются
+    по индексам с тем же курсором и склеиваются UNION ALL.
+    """
+    after_sql = ''
+    after_params = []
+    if after is not None:
+        after_sql = 'AND (pub_date, {}) < (%s, %s)'
+        after_params = [
+            connection.ops.adapt_datetimefield_value(after[0]),
+            after[1],
+        ]
+    return RawSQL(
+        f'''
+        SELECT recipe_id FROM (
+            SELECT * FROM (
+                SELECT recipe_id, pub_date FROM {FEED_TABLE}
+                WHERE user_id = %s {after_sql.format('recipe_id')}
+                ORDER BY pub_date DESC, recipe_id DESC
+                LIMIT %s
+            ) AS fanned_out
+            UNION ALL
+            SELECT * FROM (
+                SELECT id AS recipe_id, pub_date FROM {RECIPE_TABLE}
+                WHERE NOT in_feeds AND author_id IN (
+                    SELECT author_id FROM {SUBSCRIPTION_TABLE}
+                    WHERE subscriber_id = %s
+                ) {after_sql.format('id')}
+                ORDER BY pub_date DESC, id DESC
+                LIMIT %s
+            ) AS fanned_in
+        ) AS feed
+        ORDER BY pub_date DESC, recipe_id DESC
+        LIMIT %s
+        ''',
+        [
+            user_id, *after_params, limit,
+            user_id, *after_params, limit,
+            limit,
+        ]
+    )
@@ -0,0 +1,94 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from config import (IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY,
+                    IMAGE_VARIANTS, IMAGE_VARIANTS_FITTED, IMAGE_VARIANTS_PATH,
+                    IMAGE_WORKERS)
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS)
+
+
+def render_variant(image, variant, size, image_format):
+    if variant in IMAGE_VARIANTS_FITTED:
+        resized = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    resized.save(
+        buffer,
+        image_format,
+        quality=IMAGE_VARIANT_QUALITY,
+        optimize=True,
+    )
+    return buffer.getvalue()
+
+
+def build_image_variants(image_name):
+    """Сохраняет все размеры картинки и возвращает их пути в хранилище."""
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    with default_storage.open(image_name) as image_file:
+        image = ImageOps.exif_transpose(Image.open(image_file))
+        image = image.convert('RGB')
+    variants = {}
+    for variant, size in IMAGE_VARIANTS.items():
+        variants[variant] = {}
+        for extension, image_format in IMAGE_VARIANT_FORMATS.items():
+            variants[variant][extension] = default_storage.save(
+                f'{IMAGE_VARIANTS_PATH}{stem}_{variant}.{extension}',
+                ContentFile(render_variant(image, variant, size, image_format))
+            )
+    return variants
+
+
+def delete_image_variants(variants):
+    for paths in variants.values():
+        for path in paths.values():
+            default_storage.delete(path)
+
+
+def process_recipe_image(recipe_id, image_name, obsolete_variants):
+    """
+    Строит размеры картинки рецепта вне запроса.
+
+    Результат записывается, только если картинка рецепта за это время
+    не сменилась, иначе построенные файлы удаляются.
+    """
+    try:
+        variants = build_image_variants(image_name)
+        updated = Recipe.objects.filter(
+            pk=recipe_id,
+            image=image_name,
+        ).update(
+            image_variants=variants,
+            cache_version=F('cache_version') + 1,
+        )
+        delete_image_variants(obsolete_variants if updated else variants)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', image_name)
+    finally:
+        connection.close()
+
+
+def enqueue_image_variants(recipe, obsolete_variants=None):
+    """Ставит построение размеров картинки в очередь после коммита."""
+    recipe_id, image_name = recipe.id, recipe.image.name
+    transaction.on_commit(
+        lambda: _executor.submit(
+            process_recipe_image,
+            recipe_id,
+            image_name,
+            obsolete_variants or {},
+        )
+    )
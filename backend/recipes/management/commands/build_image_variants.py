@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_image_variants, delete_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+
+    help = 'Строит размеры картинок рецептов, у которых их ещё нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить размеры картинок всех рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        built = 0
+        for recipe in recipes.only('id', 'image', 'image_variants').iterator():
+            try:
+                variants = build_image_variants(recipe.image.name)
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(f'Рецепт {recipe.id}: {e}')
+                )
+                continue
+            delete_image_variants(recipe.image_variants)
+            recipe.image_variants = variants
+            recipe.save(update_fields=('image_variants', 'cache_version'))
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано картинок: {built}'))
@@ -0,0 +1,235 @@
+from time import monotonic
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from scipy import sparse
+
+from config import (RECOMMENDATION_BATCH_SIZE, RECOMMENDATION_FAVORITE_WEIGHT,
+                    RECOMMENDATION_NEIGHBOURS,
+                    RECOMMENDATION_SHOPPING_CART_WEIGHT,
+                    RECOMMENDATION_WRITE_BATCH_SIZE, RECOMMENDATIONS_PER_USER)
+from recipes.models import (Favorite, RecipeSimilarity, ShoppingCart,
+                            UserRecommendation)
+
+INTERACTIONS = (
+    (Favorite, RECOMMENDATION_FAVORITE_WEIGHT),
+    (ShoppingCart, RECOMMENDATION_SHOPPING_CART_WEIGHT),
+)
+
+
+def load_interactions():
+    """
+    Матрица пользователи x рецепты из избранного и корзин.
+
+    Возвращает матрицу CSR и массивы id пользователей и рецептов,
+    соответствующие её строкам и столбцам.
+    """
+    user_ids = []
+    recipe_ids = []
+    weights = []
+    for model, weight in INTERACTIONS:
+        pairs = np.array(
+            list(model.objects.values_list('user_id', 'recipe_id').iterator()),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        user_ids.append(pairs[:, 0])
+        recipe_ids.append(pairs[:, 1])
+        weights.append(np.full(len(pairs), weight, dtype=np.float32))
+    users, user_rows = np.unique(np.concatenate(user_ids), return_inverse=True)
+    recipes, recipe_columns = np.unique(
+        np.concatenate(recipe_ids),
+        return_inverse=True
+    )
+    matrix = sparse.csr_matrix(
+        (np.concatenate(weights), (user_rows, recipe_columns)),
+        shape=(len(users), len(recipes)),
+        dtype=np.float32
+    )
+    matrix.sum_duplicates()
+    return matrix, users, recipes
+
+
+def get_row_ids(matrix):
+    return np.repeat(
+        np.arange(matrix.shape[0], dtype=np.int64),
+        np.diff(matrix.indptr)
+    )
+
+
+def top_k(matrix, k):
+    """
+    k наибольших значений в каждой строке матрицы CSR.
+
+    Сортирует все ненулевые элементы один раз по (строка, -значение)
+    и оставляет первые k в каждой строке, без цикла по строкам.
+    """
+    rows = get_row_ids(matrix)
+    order = np.lexsort((-matrix.data, rows))
+    ranks = np.arange(len(order)) - matrix.indptr[rows[order]]
+    kept = order[ranks < k]
+    return rows[kept], matrix.indices[kept], matrix.data[kept]
+
+
+def get_neighbours(matrix, k, batch_size):
+    """
+    Для каждого рецепта - k самых похожих по косинусу столбцов.
+
+    Произведение Xᵀ·X считается пачками по batch_size рецептов, чтобы
+    не держать в памяти всю матрицу сходства. Возвращает матрицу
+    рецепты x рецепты, где в строке не больше k значений.
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    normalized = (matrix @ sparse.diags(1 / norms)).tocsr()
+    transposed = normalized.T.tocsr()
+    rows, columns, scores = [], [], []
+    for start in range(0, matrix.shape[1], batch_size):
+        block = (transposed[start:start + batch_size] @ normalized).tocsr()
+        block.data[block.indices == get_row_ids(block) + start] = 0
+        block.eliminate_zeros()
+        block_rows, block_columns, block_scores = top_k(block, k)
+        rows.append(block_rows + start)
+        columns.append(block_columns)
+        scores.append(block_scores)
+    return sparse.csr_matrix(
+        (
+            np.concatenate(scores),
+            (np.concatenate(rows), np.concatenate(columns)),
+        ),
+        shape=(matrix.shape[1], matrix.shape[1]),
+        dtype=np.float32
+    )
+
+
+def get_recommendations(matrix, neighbours, k, batch_size):
+    """
+    Для каждого пользователя - k рецептов с наибольшей суммой сходства
+    с его избранным и корзиной, кроме уже добавленных.
+    """
+    rows, columns, scores = [], [], []
+    for start in range(0, matrix.shape[0], batch_size):
+        interactions = matrix[start:start + batch_size]
+        block = (interactions @ neighbours).tocsr()
+        block = (block - block.multiply(interactions > 0)).tocsr()
+        block.eliminate_zeros()
+        block_rows, block_columns, block_scores = top_k(block, k)
+        rows.append(block_rows + start)
+        columns.append(block_columns)
+        scores.append(block_scores)
+    return (
+        np.concatenate(rows),
+        np.concatenate(columns),
+        np.concatenate(scores),
+    )
+
+
+def write_rows(model, fields, *columns):
+    """Записывает строки пачками, пропуская удалённые за время расчёта."""
+    for index, field in enumerate(fields):
+        existing = np.fromiter(
+            field.related_model.objects.values_list('id', flat=True),
+            dtype=np.int64
+        )
+        kept = np.isin(columns[index], existing)
+        columns = [values[kept] for values in columns]
+    names = [field.attname for field in fields] + ['score']
+    rows = list(zip(*(values.tolist() for values in columns)))
+    for start in range(0, len(rows), RECOMMENDATION_WRITE_BATCH_SIZE):
+        model.objects.bulk_create(
+            model(**dict(zip(names, row)))
+            for row in rows[start:start + RECOMMENDATION_WRITE_BATCH_SIZE]
+        )
+    return len(rows)
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Пересчитывает похожие рецепты и рекомендации пользователям '
+        'по совместному избранному и корзинам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours',
+            type=int,
+            default=RECOMMENDATION_NEIGHBOURS,
+            help='Сколько похожих рецептов хранить для рецепта.',
+        )
+        parser.add_argument(
+            '--per-user',
+            type=int,
+            default=RECOMMENDATIONS_PER_USER,
+            help='Сколько рекомендаций хранить для пользователя.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=RECOMMENDATION_BATCH_SIZE,
+            help='Сколько строк матрицы перемножать за раз.',
+        )
+
+    def log(self, message, started):
+        self.stdout.write(f'{message} ({monotonic() - started:.1f} с)')
+
+    def handle(self, *args, **options):
+        started = monotonic()
+        matrix, users, recipes = load_interactions()
+        if not matrix.nnz:
+            with transaction.atomic():
+                RecipeSimilarity.objects.all().delete()
+                UserRecommendation.objects.all().delete()
+            self.stdout.write(self.style.WARNING('Нет избранного и корзин.'))
+            return
+        self.log(
+            f'Матрица {matrix.shape[0]} x {matrix.shape[1]}, '
+            f'связей: {matrix.nnz}',
+            started
+        )
+        neighbours = get_neighbours(
+            matrix,
+            options['neighbours'],
+            options['batch_size']
+        )
+        self.log(f'Похожих рецептов: {neighbours.nnz}', started)
+        user_rows, recipe_columns, scores = get_recommendations(
+            matrix,
+            neighbours,
+            options['per_user'],
+            options['batch_size']
+        )
+        self.log(f'Рекомендаций: {len(scores)}', started)
+        neighbour_rows = get_row_ids(neighbours)
+        with transaction.atomic():
+            RecipeSimilarity.objects.all()._raw_delete(
+                RecipeSimilarity.objects.db
+            )
+            UserRecommendation.objects.all()._raw_delete(
+                UserRecommendation.objects.db
+            )
+            similarities = write_rows(
+                RecipeSimilarity,
+                (
+                    RecipeSimilarity._meta.get_field('recipe'),
+                    RecipeSimilarity._meta.get_field('similar_recipe'),
+                ),
+                recipes[neighbour_rows],
+                recipes[neighbours.indices],
+                neighbours.data,
+            )
+            recommendations = write_rows(
+                UserRecommendation,
+                (
+                    UserRecommendation._meta.get_field('user'),
+                    UserRecommendation._meta.get_field('recipe'),
+                ),
+                users[user_rows],
+                recipes[recipe_columns],
+                scores,
+            )
+        self.log(
+            f'Записано похожих рецептов: {similarities}, '
+            f'рекомендаций: {recommendations}',
+            started
+        )
+        self.stdout.write(self.style.SUCCESS('Готово.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from config import TRENDING_DECAY_FACTOR
+from recipes.counters import decay_trending
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Гасит трендовость рецептов. Запускается по расписанию: '
+        'с множителем по умолчанию и запуском раз в час трендовость '
+        'без новых добавлений падает вдвое за сутки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--factor',
+            type=float,
+            default=TRENDING_DECAY_FACTOR,
+            help='Множитель трендовости, от 0 до 1.',
+        )
+
+    def handle(self, *args, **options):
+        factor = options['factor']
+        if not 0 < factor <= 1:
+            raise CommandError('Множитель должен быть от 0 до 1.')
+        decayed = decay_trending(factor)
+        self.stdout.write(self.style.SUCCESS(
+            f'Трендовость изменена у рецептов: {decayed}'
+        ))
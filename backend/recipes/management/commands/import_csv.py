@@ -1,65 +1,175 @@
 import csv
+import sys
+from contextlib import nullcontext
+from itertools import islice
 
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 
-from recipes.models import Ingredient, Tag
+from config import (IMPORT_CSV_BATCH_SIZE, IMPORT_CSV_MAX_ERRORS,
+                    IMPORT_CSV_PROGRESS_ROWS, INGREDIENTS_VERSION_KEY,
+                    TAGS_VERSION_KEY)
+from recipes.models import DataVersion, Ingredient, Tag
 
-csv_files = {
-    'ingredients.csv': Ingredient,
-    'tags.csv': Tag,
+csv_models = {
+    'ingredients': (Ingredient, INGREDIENTS_VERSION_KEY),
+    'tags': (Tag, TAGS_VERSION_KEY),
 }
+default_paths = (
+    'data_for_test/ingredients.csv',
+    'data_for_test/tags.csv',
+)
 
 
 class Command(BaseCommand):
 
+    help = (
+        'Загружает ингредиенты и теги из CSV-файлов. Модель определяется '
+        'по заголовку файла, "-" вместо пути читает стандартный ввод.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=default_paths,
+            help='Пути к CSV-файлам, по умолчанию файлы из data_for_test/.',
+        )
+        parser.add_argument(
+            '--model',
+            choices=csv_models,
+            help='Модель для всех файлов вместо определения по заголовку.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_CSV_BATCH_SIZE,
+            help='Сколько строк проверять и записывать за раз.',
+        )
+
+    @transaction.atomic
     def handle(self, *args, **options):
-        """Функция валидации полей и импорта."""
-        for csv_file_name, model in csv_files.items():
+        """Загружает все файлы в одной транзакции."""
+        for path in options['paths']:
             try:
-                with open(
-                        f'data_for_test/{csv_file_name}',
-                        'r',
-                        encoding='utf-8'
-                ) as csvfile:
-                    rows = list(csv.DictReader(csvfile))
-            except FileNotFoundError:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'Файл {csv_file_name} не найден.'
-                    )
+                csvfile = (
+                    nullcontext(sys.stdin) if path == '-'
+                    else open(path, 'r', encoding='utf-8', newline='')
                 )
-                continue
-            except Exception as e:
+            except OSError as e:
                 self.stdout.write(
-                    self.style.ERROR(
-                        f'Ошибка при чтении файла {csv_file_name}: {e}'
-                    )
+                    self.style.ERROR(f'Не удалось открыть файл {path}: {e}')
                 )
                 continue
+            with csvfile as rows:
+                self.import_rows(
+                    path,
+                    csv.DictReader(rows),
+                    options['model'],
+                    options['batch_size'],
+                )
+
+    def get_model(self, reader, model_name):
+        if model_name:
+            return csv_models[model_name]
+        header = set(reader.fieldnames or ())
+        for model, version_key in csv_models.values():
+            names = {
+                field.name for field in model._meta.concrete_fields
+                if not field.primary_key
+            }
+            if header == names:
+                return model, version_key
+        return None, None
+
+    @staticmethod
+    def insert_values(model, fields, values):
+        """
+        Вставляет строки многострочным INSERT, пропуская уже существующие.
+
+        Возвращает число добавленных строк.
+        """
+        quote_name = connection.ops.quote_name
+        columns = ', '.join(quote_name(field.column) for field in fields)
+        placeholder = '({})'.format(', '.join(['%s'] * len(fields)))
+        step = connection.ops.bulk_batch_size(fields, values) or len(values)
+        created_count = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(values), step):
+                chunk = values[start:start + step]
+                cursor.execute(
+                    f'''
+                    INSERT INTO {quote_name(model._meta.db_table)} ({columns})
+                    VALUES {', '.join([placeholder] * len(chunk))}
+                    ON CONFLICT DO NOTHING
+                    ''',
+                    [
+                        field.get_db_prep_save(value, connection)
+                        for row in chunk
+                        for field, value in zip(fields, row)
+                    ]
+                )
+                created_count += cursor.rowcount
+        return created_count
+
+    def write_progress(self, path, rows_count, batch_count):
+        """
+        В терминале прогресс переписывает одну строку, в файл или лог
+        выводится отдельной строкой раз в IMPORT_CSV_PROGRESS_ROWS строк.
+        """
+        message = f'{path}: обработано строк {rows_count}'
+        if self.stdout.isatty():
+            self.stdout.write(message, ending='\r')
+        elif (rows_count // IMPORT_CSV_PROGRESS_ROWS
+              > (rows_count - batch_count) // IMPORT_CSV_PROGRESS_ROWS):
+            self.stdout.write(message)
+
+    def import_rows(self, path, reader, model_name, batch_size):
+        """Проверяет строки пачками и записывает каждую пачку одним INSERT."""
+        model, version_key = self.get_model(reader, model_name)
+        if model is None:
+            self.stdout.write(self.style.ERROR(
+                f'{path}: не удалось определить модель по заголовку '
+                f'{reader.fieldnames}.'
+            ))
+            return
+        try:
+            fields = [
+                model._meta.get_field(name) for name in reader.fieldnames
+            ]
+        except FieldDoesNotExist as e:
+            self.stdout.write(self.style.ERROR(f'{path}: {e}'))
+            return
+        rows_count = invalid_count = created_count = 0
+        while True:
+            rows = list(islice(reader, batch_size))
+            if not rows:
+                break
+            values = []
             for row in rows:
+                rows_count += 1
                 try:
-                    item, created = model.objects.get_or_create(**row)
-                    item.full_clean()
-                    item.save()
-                    if created:
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f'Запись для модели {model.__name__} '
-                                f'добавлена: {row}'
-                            )
-                        )
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'Запись для модели {model.__name__} '
-                                f'уже существует: {row}'
-                            )
-                        )
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f'Ошибка при создании объекта '
-                            f'{model.__name__}: {e}'
-                        )
-                    )
-                    continue
+                    values.append([
+                        field.clean(row[field.name], None)
+                        for field in fields
+                    ])
+                except ValidationError as e:
+                    invalid_count += 1
+                    if invalid_count <= IMPORT_CSV_MAX_ERRORS:
+                        self.stdout.write(self.style.ERROR(
+                            f'{path}, строка {rows_count}: '
+                            f'{"; ".join(e.messages)}'
+                        ))
+            created_count += self.insert_values(model, fields, values)
+            self.write_progress(path, rows_count, len(rows))
+        if created_count:
+            # Вставка идёт в обход ORM и сигналов, версию данных
+            # для кэшей поднимаем сами.
+            DataVersion.bump(version_key)
+        self.stdout.write(self.style.SUCCESS(
+            f'{path}: {model._meta.verbose_name_plural}, строк {rows_count}, '
+            f'добавлено {created_count}, '
+            f'уже были {rows_count - invalid_count - created_count}, '
+            f'с ошибками {invalid_count}.'
+        ))
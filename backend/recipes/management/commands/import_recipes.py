@@ -0,0 +1,65 @@
+import sys
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from config import RECIPE_IMPORT_MAX_ERRORS
+from recipes.bulk_import import RecipeImportError, import_recipes, read_ndjson
+from recipes.models import User
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Загружает рецепты из NDJSON-файла, по рецепту в строке. '
+        '"-" вместо пути читает стандартный ввод.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к NDJSON-файлу или "-".')
+        parser.add_argument(
+            '--author',
+            help='Автор рецептов без поля author (username).',
+        )
+        parser.add_argument(
+            '--images-dir',
+            help='Каталог, относительно которого ищутся файлы картинок.',
+        )
+        parser.add_argument(
+            '--skip-image-variants',
+            action='store_true',
+            help='Не строить размеры картинок после загрузки.',
+        )
+
+    def handle(self, *args, **options):
+        default_author = None
+        if options['author']:
+            default_author = User.objects.filter(
+                username=options['author']
+            ).first()
+            if default_author is None:
+                raise CommandError(f'Нет пользователя {options["author"]}.')
+        try:
+            if options['path'] == '-':
+                records = read_ndjson(sys.stdin)
+            else:
+                with open(options['path'], 'r', encoding='utf-8') as lines:
+                    records = read_ndjson(lines)
+            recipes = import_recipes(
+                records,
+                default_author=default_author,
+                images_dir=options['images_dir'],
+            )
+        except OSError as e:
+            raise CommandError(f'Не удалось прочитать файл: {e}')
+        except RecipeImportError as e:
+            for number, error in e.errors[:RECIPE_IMPORT_MAX_ERRORS]:
+                self.stdout.write(self.style.ERROR(
+                    f'Строка {number}: {error}'
+                ))
+            raise CommandError(f'{e}. Рецепты не загружены.')
+        self.stdout.write(
+            self.style.SUCCESS(f'Загружено рецептов: {len(recipes)}')
+        )
+        if not options['skip_image_variants']:
+            call_command('build_image_variants', stdout=self.stdout)
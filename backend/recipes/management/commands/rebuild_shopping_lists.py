@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.shopping_lists import find_drifted_users, rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+
+    help = 'Сверяет списки покупок с корзинами и пересобирает разошедшиеся.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, ничего не меняя.',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересобрать списки всех пользователей без сверки.',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            with transaction.atomic():
+                rebuild_shopping_lists()
+            self.stdout.write(self.style.SUCCESS('Все списки пересобраны.'))
+            return
+        with transaction.atomic():
+            user_ids = find_drifted_users()
+            if not user_ids:
+                self.stdout.write(
+                    self.style.SUCCESS('Расхождений не найдено.')
+                )
+                return
+            if options['check']:
+                raise CommandError(
+                    f'Списки покупок разошлись у пользователей: {user_ids}'
+                )
+            rebuild_shopping_lists(user_ids)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Пересобраны списки пользователей: {user_ids}'
+            )
+        )
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.16 on 2026-10-17 06:51
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def delete_duplicate_subscriptions(apps, schema_editor):
+    Subscription = apps.get_model('recipes', 'Subscription')
+    User = apps.get_model('recipes', 'User')
+    duplicates = Subscription.objects.values(
+        'subscriber', 'author'
+    ).annotate(
+        first_id=Min('id'),
+        count=Count('id'),
+    ).filter(count__gt=1)
+    author_ids = set()
+    for duplicate in duplicates:
+        Subscription.objects.filter(
+            subscriber=duplicate['subscriber'],
+            author=duplicate['author'],
+        ).exclude(id=duplicate['first_id']).delete()
+        author_ids.add(duplicate['author'])
+    User.objects.filter(id__in=author_ids).update(
+        subscribers_count=Coalesce(
+            Subquery(
+                Subscription.objects.filter(
+                    author=OuterRef('pk')
+                ).order_by().values('author').annotate(
+                    count=Count('pk')
+                ).values('count')
+            ),
+            0
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_subscriptions,
+            migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('subscriber', 'author'), name='recipes_subscription_unique_constraint'),
+        ),
+    ]
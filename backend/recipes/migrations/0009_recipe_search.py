@@ -0,0 +1,135 @@
+import re
+
+from django.db import migrations
+
+POSTGRESQL_SQL = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+POSTGRESQL_REVERSE_SQL = (
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+SQLITE_SQL = (
+    "CREATE VIRTUAL TABLE recipes_recipe_search "
+    "USING fts5(name, ingredients, text, tokenize='unicode61')",
+)
+SQLITE_REVERSE_SQL = (
+    # Триггер удаления создавали прежние версии миграции.
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_delete',
+    'DROP TABLE recipes_recipe_search',
+)
+POSTGRESQL_FILL_SQL = '''
+    UPDATE recipes_recipe AS recipe
+    SET search_vector =
+        setweight(to_tsvector('russian', recipe.name), 'A')
+        || setweight(to_tsvector('russian', COALESCE((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_ingredientrecipe AS ingredient_recipe
+            INNER JOIN recipes_ingredient AS ingredient
+                ON ingredient.id = ingredient_recipe.ingredient_id
+            WHERE ingredient_recipe.recipe_id = recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', recipe.text), 'C')
+'''
+SQLITE_FILL_SQL = '''
+    INSERT INTO recipes_recipe_search (rowid, name, ingredients, text)
+    VALUES (%s, %s, %s, %s)
+'''
+BATCH_SIZE = 1000
+
+# Стеммер на момент миграции, как в recipes.search: документы в SQLite
+# хранятся уже приведёнными к основам.
+WORD_PATTERN = re.compile(r'\w+')
+VOWELS = 'аеиоуыэюя'
+RUSSIAN_ENDINGS = sorted(
+    {
+        'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое',
+        'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую',
+        'юю', 'ая', 'яя', 'ою', 'ею',
+        'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'иям', 'ям', 'ам', 'ием',
+        'ев', 'ов', 'ия', 'ья', 'ию', 'ью', 'ье', 'еи', 'ии', 'ь', 'а',
+        'е', 'и', 'й', 'о', 'у', 'ы', 'ю', 'я',
+    },
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 2
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    start = next(
+        (index + 1 for index, letter in enumerate(word) if letter in VOWELS),
+        None
+    )
+    if start is None:
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= max(start, MIN_STEM_LENGTH)):
+            return word[:-len(ending)]
+    return word
+
+
+def get_stems(text):
+    return ' '.join(stem(word) for word in WORD_PATTERN.findall(text or ''))
+
+
+def fill_sqlite_index(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ingredients = {}
+    for recipe_id, name in IngredientRecipe.objects.values_list(
+        'recipe_id', 'ingredient__name'
+    ).iterator():
+        ingredients.setdefault(recipe_id, []).append(get_stems(name))
+    documents = (
+        (
+            recipe_id,
+            get_stems(name),
+            ' '.join(ingredients.get(recipe_id, ())),
+            get_stems(text),
+        )
+        for recipe_id, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'
+        ).iterator()
+    )
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            batch = [row for _, row in zip(range(BATCH_SIZE), documents)]
+            if not batch:
+                break
+            cursor.executemany(SQLITE_FILL_SQL, batch)
+
+
+def execute(schema_editor, postgresql_sql, sqlite_sql):
+    if schema_editor.connection.vendor == 'postgresql':
+        statements = postgresql_sql
+    else:
+        statements = sqlite_sql
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    execute(schema_editor, POSTGRESQL_SQL, SQLITE_SQL)
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_FILL_SQL)
+    else:
+        fill_sqlite_index(apps, schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    execute(schema_editor, POSTGRESQL_REVERSE_SQL, SQLITE_REVERSE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_subscription_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Значения FEED_FANOUT_MAX_SUBSCRIBERS и FEED_MAX_ITEMS на момент миграции.
+FANOUT_MAX_SUBSCRIBERS = 1000
+FEED_MAX_ITEMS = 500
+
+
+def build_feeds(apps, schema_editor):
+    """Раскладывает рецепты по лентам подписчиков, как rebuild_feeds."""
+    quote_name = schema_editor.connection.ops.quote_name
+    feed_table, recipe_table, subscription_table, user_table = (
+        quote_name(apps.get_model('recipes', name)._meta.db_table)
+        for name in ('FeedItem', 'Recipe', 'Subscription', 'User')
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            UPDATE {recipe_table} SET in_feeds = author_id NOT IN (
+                SELECT id FROM {user_table} WHERE subscribers_count > %s
+            )
+            ''',
+            [FANOUT_MAX_SUBSCRIBERS]
+        )
+        cursor.execute(
+            f'''
+            INSERT INTO {feed_table} (user_id, author_id, recipe_id, pub_date)
+            SELECT subscriber_id, author_id, id, pub_date FROM (
+                SELECT subscription.subscriber_id, recipe.author_id,
+                    recipe.id, recipe.pub_date,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY subscription.subscriber_id
+                        ORDER BY recipe.pub_date DESC, recipe.id DESC
+                    ) AS position
+                FROM {recipe_table} AS recipe
+                INNER JOIN {subscription_table} AS subscription
+                    ON subscription.author_id = recipe.author_id
+                WHERE recipe.in_feeds
+            ) AS ranked
+            WHERE ranked.position <= %s
+            ''',
+            [FEED_MAX_ITEMS]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_feeds',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Разослан по лентам'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('in_feeds', False)), fields=['author', '-pub_date', '-id'], name='recipe_not_in_feeds_idx'),
+        ),
+        migrations.AddField(
+            model_name='feeditem',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AddField(
+            model_name='feeditem',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeditems', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='feeditem',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeditems', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feeditem_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='recipes_feeditem_unique_constraint'),
+        ),
+        migrations.RunPython(build_feeds, migrations.RunPython.noop),
+    ]
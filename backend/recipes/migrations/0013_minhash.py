@@ -0,0 +1,117 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:10
+
+import random
+
+from django.db import migrations, models
+import django.db.models.deletion
+import numpy as np
+
+# Параметры и хеш-функции recipes.minhash на момент миграции: подписи
+# должны совпадать с теми, что пересчитывает приложение.
+BANDS = 16
+ROWS = 4
+SEED = 20240501
+BATCH_SIZE = 5000
+PRIME = 2 ** 31 - 1
+SIGNATURE_DTYPE = np.dtype('<u4')
+_random = random.Random(SEED)
+HASH_A = np.array(
+    [_random.randrange(1, PRIME) for _ in range(BANDS * ROWS)],
+    dtype=np.int64
+)
+HASH_B = np.array(
+    [_random.randrange(PRIME) for _ in range(BANDS * ROWS)],
+    dtype=np.int64
+)
+BAND_MULTIPLIERS = np.array(
+    [_random.getrandbits(64) | 1 for _ in range(ROWS)],
+    dtype=np.uint64
+)
+del _random
+
+
+def write_signatures(apps, recipe_ids):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    RecipeSignature = apps.get_model('recipes', 'RecipeSignature')
+    RecipeBucket = apps.get_model('recipes', 'RecipeBucket')
+    pairs = np.array(
+        IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('recipe_id').values_list('recipe_id', 'ingredient_id'),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    if not len(pairs):
+        return
+    starts = np.flatnonzero(
+        np.concatenate(([True], pairs[1:, 0] != pairs[:-1, 0]))
+    )
+    hashes = (pairs[:, 1, None] * HASH_A + HASH_B) % PRIME
+    signatures = np.minimum.reduceat(
+        hashes,
+        starts,
+        axis=0
+    ).astype(SIGNATURE_DTYPE)
+    buckets = (
+        signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+        * BAND_MULTIPLIERS
+    ).sum(axis=2).view(np.int64)
+    recipe_ids = pairs[starts, 0].tolist()
+    RecipeSignature.objects.bulk_create(
+        RecipeSignature(recipe_id=recipe_id, signature=signature.tobytes())
+        for recipe_id, signature in zip(recipe_ids, signatures)
+    )
+    RecipeBucket.objects.bulk_create(
+        RecipeBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+        for recipe_id, recipe_buckets in zip(recipe_ids, buckets.tolist())
+        for band, bucket in enumerate(recipe_buckets)
+    )
+
+
+def build_signatures(apps, schema_editor):
+    """Считает подписи и корзины LSH всех рецептов, как update_signatures."""
+    recipe_ids = list(
+        apps.get_model('recipes', 'Recipe').objects.order_by(
+            'id'
+        ).values_list('id', flat=True)
+    )
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        write_signatures(apps, recipe_ids[start:start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSignature',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('signature', models.BinaryField(verbose_name='Подпись')),
+            ],
+            options={
+                'verbose_name': 'Подпись рецепта',
+                'verbose_name_plural': 'Подписи рецептов',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField(verbose_name='Полоса')),
+                ('bucket', models.BigIntegerField(verbose_name='Корзина')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Корзина LSH',
+                'verbose_name_plural': 'Корзины LSH',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipebucket',
+            index=models.Index(fields=['band', 'bucket'], name='recipebucket_band_bucket_idx'),
+        ),
+        migrations.RunPython(build_signatures, migrations.RunPython.noop),
+    ]
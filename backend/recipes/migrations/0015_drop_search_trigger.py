@@ -0,0 +1,29 @@
+# Generated by Django 3.2.16 on 2026-10-17 09:12
+
+from django.db import migrations
+
+SQLITE_SQL = (
+    # Триггер из 0009 пропадал при пересоздании таблицы рецептов,
+    # документы удалённых рецептов теперь убирает сигнал post_delete.
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_delete',
+    'DELETE FROM recipes_recipe_search '
+    'WHERE rowid NOT IN (SELECT id FROM recipes_recipe)',
+)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+    for sql in SQLITE_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_trigger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,174 @@
+import random
+
+import numpy as np
+from django.db import connection
+
+from config import (MINHASH_BANDS, MINHASH_BATCH_SIZE, MINHASH_MAX_CANDIDATES,
+                    MINHASH_ROWS, MINHASH_SEED, MINHASH_SIMILAR_RECIPES)
+from recipes.models import (IngredientRecipe, Recipe, RecipeBucket,
+                            RecipeSignature)
+
+BUCKET_TABLE = connection.ops.quote_name(RecipeBucket._meta.db_table)
+RECIPE_TAG_TABLE = connection.ops.quote_name(
+    Recipe.tags.through._meta.db_table
+)
+
+PRIME = 2 ** 31 - 1
+SIGNATURE_DTYPE = np.dtype('<u4')
+HASHES = MINHASH_BANDS * MINHASH_ROWS
+_random = random.Random(MINHASH_SEED)
+# Хеш-функции вида (a * x + b) mod PRIME: по одной на значение подписи.
+HASH_A = np.array(
+    [_random.randrange(1, PRIME) for _ in range(HASHES)],
+    dtype=np.int64
+)
+HASH_B = np.array(
+    [_random.randrange(PRIME) for _ in range(HASHES)],
+    dtype=np.int64
+)
+# Нечётные множители, которыми полоса сворачивается в номер корзины.
+BAND_MULTIPLIERS = np.array(
+    [_random.getrandbits(64) | 1 for _ in range(MINHASH_ROWS)],
+    dtype=np.uint64
+)
+del _random
+
+
+def get_signatures(recipe_ids, ingredient_ids):
+    """
+    MinHash-подписи рецептов по парам (рецепт, ингредиент).
+
+    Пары должны быть упорядочены по рецепту. Возвращает id рецептов
+    и матрицу подписей, по строке на рецепт.
+    """
+    starts = np.flatnonzero(
+        np.concatenate(([True], recipe_ids[1:] != recipe_ids[:-1]))
+    )
+    hashes = (ingredient_ids[:, None] * HASH_A + HASH_B) % PRIME
+    return (
+        recipe_ids[starts],
+        np.minimum.reduceat(hashes, starts, axis=0).astype(SIGNATURE_DTYPE)
+    )
+
+
+def get_buckets(signatures):
+    """Номера корзин: каждая полоса подписи сворачивается в 64 бита."""
+    bands = signatures.reshape(
+        len(signatures),
+        MINHASH_BANDS,
+        MINHASH_ROWS
+    ).astype(np.uint64)
+    return (bands * BAND_MULTIPLIERS).sum(axis=2).view(np.int64)
+
+
+def update_signatures(recipe_ids=None):
+    """
+    Пересчитывает подписи и корзины рецептов (или всех рецептов).
+
+    Вызывается после записи ингредиентов рецепта, в той же транзакции.
+    """
+    if recipe_ids is None:
+        RecipeBucket.objects.all()._raw_delete(RecipeBucket.objects.db)
+        RecipeSignature.objects.all()._raw_delete(RecipeSignature.objects.db)
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id',
+            flat=True
+        )
+        for start in range(0, recipe_ids.count(), MINHASH_BATCH_SIZE):
+            write_signatures(
+                list(recipe_ids[start:start + MINHASH_BATCH_SIZE]),
+                replace=False
+            )
+        return
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), MINHASH_BATCH_SIZE):
+        write_signatures(recipe_ids[start:start + MINHASH_BATCH_SIZE])
+
+
+def write_signatures(recipe_ids, replace=True):
+    if not recipe_ids:
+        return
+    if replace:
+        RecipeBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+    pairs = np.array(
+        IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('recipe_id').values_list('recipe_id', 'ingredient_id'),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    if not len(pairs):
+        return
+    recipe_ids, signatures = get_signatures(pairs[:, 0], pairs[:, 1])
+    buckets = get_buckets(signatures)
+    RecipeSignature.objects.bulk_create(
+        RecipeSignature(recipe_id=recipe_id, signature=signature.tobytes())
+        for recipe_id, signature in zip(recipe_ids.tolist(), signatures)
+    )
+    RecipeBucket.objects.bulk_create(
+        RecipeBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+        for recipe_id, recipe_buckets in zip(
+            recipe_ids.tolist(),
+            buckets.tolist()
+        )
+        for band, bucket in enumerate(recipe_buckets)
+    )
+
+
+def find_similar_recipes(recipe_id, shared_tags=False,
+                         limit=MINHASH_SIMILAR_RECIPES):
+    """
+    Рецепты с самыми похожими наборами ингредиентов.
+
+    Кандидаты - рецепты из общих с рецептом корзин LSH, не больше
+    MINHASH_MAX_CANDIDATES с наибольшим числом общих полос. Они
+    упорядочиваются по оценке близости по Жаккару - доле совпавших
+    значений подписи. Возвращает пары (id рецепта, оценка).
+    """
+    tags_condition = ''
+    if shared_tags:
+        tags_condition = f'''
+            AND EXISTS (
+                SELECT 1 FROM {RECIPE_TAG_TABLE} AS own_tag
+                INNER JOIN {RECIPE_TAG_TABLE} AS other_tag
+                    ON other_tag.tag_id = own_tag.tag_id
+                WHERE own_tag.recipe_id = own.recipe_id
+                    AND other_tag.recipe_id = other.recipe_id
+            )
+        '''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT other.recipe_id
+            FROM {BUCKET_TABLE} AS own
+            INNER JOIN {BUCKET_TABLE} AS other
+                ON other.band = own.band AND other.bucket = own.bucket
+            WHERE own.recipe_id = %s AND other.recipe_id <> %s
+                {tags_condition}
+            GROUP BY other.recipe_id
+            ORDER BY COUNT(*) DESC, other.recipe_id DESC
+            LIMIT %s
+            ''',
+            [recipe_id, recipe_id, MINHASH_MAX_CANDIDATES]
+        )
+        candidates = [row[0] for row in cursor.fetchall()]
+    if not candidates:
+        return []
+    signatures = dict(RecipeSignature.objects.filter(
+        recipe_id__in=[recipe_id, *candidates]
+    ).values_list('recipe_id', 'signature'))
+    if recipe_id not in signatures:
+        return []
+    candidates = [
+        candidate for candidate in candidates if candidate in signatures
+    ]
+    if not candidates:
+        return []
+    own = np.frombuffer(signatures[recipe_id], dtype=SIGNATURE_DTYPE)
+    others = np.stack([
+        np.frombuffer(signatures[candidate], dtype=SIGNATURE_DTYPE)
+        for candidate in candidates
+    ])
+    scores = (others == own).mean(axis=1)
+    order = np.lexsort((-np.array(candidates), -scores))[:limit]
+    return [(candidates[index], float(scores[index])) for index in order]
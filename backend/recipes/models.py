@@ -2,11 +2,13 @@ from colorfield.fields import ColorField
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connection, models
 
 from config import (AMOUNT_MAX_VALUE, AMOUNT_MIN_VALUE, COOK_TIME_MAX_VALUE,
-                    COOK_TIME_MIN_VALUE, EMAIL_FIELD_LENGTH, FIRST_NAME_LENGTH,
-                    LAST_NAME_LENGTH, NAME_MAX_LENGTH, SLICE_STR_METHOD_LIMIT,
+                    COOK_TIME_MIN_VALUE, DATA_VERSION_KEY_LENGTH,
+                    EMAIL_FIELD_LENGTH, FIRST_NAME_LENGTH, LAST_NAME_LENGTH,
+                    NAME_MAX_LENGTH, RECIPE_INDEX_MAX_CHANGES,
+                    RECIPES_VERSION_KEY, SLICE_STR_METHOD_LIMIT,
                     SLUG_MAX_LENGTH, TAG_COLOR_MAX_LENGTH, USERNAME_LENGTH)
 from recipes.validators import validate_not_me, validate_username_via_regex
 
@@ -35,6 +37,16 @@ class User(AbstractUser):
         max_length=LAST_NAME_LENGTH,
         verbose_name='Фамилия',
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Кол-во рецептов',
+        default=0,
+        editable=False,
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Кол-во подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
 
@@ -64,6 +76,12 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('subscriber', 'author'),
+                name='%(app_label)s_%(class)s_unique_constraint',
+            ),
+        )
 
     def __str__(self):
         return f'{self.subscriber} подписан на {self.author}'
@@ -178,12 +196,57 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    cache_version = models.PositiveIntegerField(
+        verbose_name='Версия кэша',
+        default=0,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном, раз',
+        default=0,
+        editable=False,
+    )
+    image_variants = models.JSONField(
+        verbose_name='Размеры картинки',
+        default=dict,
+        editable=False,
+    )
+    in_feeds = models.BooleanField(
+        verbose_name='Разослан по лентам',
+        default=True,
+        editable=False,
+    )
+    popularity = models.PositiveIntegerField(
+        verbose_name='Популярность',
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        verbose_name='Трендовость',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
         default_related_name = 'recipes'
+        indexes = (
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                condition=models.Q(in_feeds=False),
+                name='recipe_not_in_feeds_idx',
+            ),
+            models.Index(
+                fields=('-popularity', '-pub_date', '-id'),
+                name='recipe_popularity_idx',
+            ),
+            models.Index(
+                fields=('-trending_score', '-pub_date', '-id'),
+                name='recipe_trending_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.name} {self.author}'
@@ -270,3 +333,295 @@ class Favorite(UserRecipeModel):
     class Meta(UserRecipeModel.Meta):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Общее количество',
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        default_related_name = 'shoppinglistitems'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='Unique_user_ingredient',
+            ),
+        )
+
+    def __str__(self):
+        return (f'{self.user} {self.ingredient} '
+                f'{self.total_amount}')[:SLICE_STR_METHOD_LIMIT]
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписчика автора."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feeditems',
+        verbose_name='Подписчик',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feeditems',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='%(app_label)s_%(class)s_unique_constraint',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feeditem_user_pub_date_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
+
+
+class RecipeSimilarity(models.Model):
+    """Похожий рецепт: его добавляют в избранное и корзину те же люди."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarities',
+        verbose_name='Рецепт',
+    )
+    similar_recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='recipesimilarity_score_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} {self.similar_recipe}'
+
+
+class UserRecommendation(models.Model):
+    """Рецепт, рекомендованный пользователю по его избранному и корзине."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name='Рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Оценка',
+    )
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        indexes = (
+            models.Index(
+                fields=('user', '-score'),
+                name='userrecommendation_score_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
+
+
+class RecipeSignature(models.Model):
+    """MinHash-подпись набора ингредиентов рецепта."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Рецепт',
+    )
+    signature = models.BinaryField(
+        verbose_name='Подпись',
+    )
+
+    class Meta:
+        verbose_name = 'Подпись рецепта'
+        verbose_name_plural = 'Подписи рецептов'
+
+    def __str__(self):
+        return str(self.recipe)
+
+
+class RecipeBucket(models.Model):
+    """Корзина LSH: рецепты с одинаковой полосой подписи."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='buckets',
+        verbose_name='Рецепт',
+    )
+    band = models.PositiveSmallIntegerField(
+        verbose_name='Полоса',
+    )
+    bucket = models.BigIntegerField(
+        verbose_name='Корзина',
+    )
+
+    class Meta:
+        verbose_name = 'Корзина LSH'
+        verbose_name_plural = 'Корзины LSH'
+        indexes = (
+            models.Index(
+                fields=('band', 'bucket'),
+                name='recipebucket_band_bucket_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} {self.band}'
+
+
+class DataVersion(models.Model):
+    """Счётчик изменений набора данных, общий для всех процессов."""
+
+    key = models.CharField(
+        verbose_name='Ключ',
+        max_length=DATA_VERSION_KEY_LENGTH,
+        unique=True,
+    )
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.key} {self.version}'
+
+    @classmethod
+    def get_version(cls, key):
+        return cls.objects.filter(key=key).values_list(
+            'version',
+            flat=True
+        ).first() or 0
+
+    @classmethod
+    def bump(cls, *keys):
+        """
+        Поднимает версии ключей одним INSERT ... ON CONFLICT.
+
+        Новый ключ получает версию 1. Одновременные первые изменения
+        ключа не сходятся на одной версии, как при UPDATE и вставке
+        отдельными запросами. Ключи сортируются, чтобы транзакции
+        блокировали строки в одном порядке.
+        """
+        keys = sorted(set(keys))
+        if not keys:
+            return
+        table = connection.ops.quote_name(cls._meta.db_table)
+        key_column = connection.ops.quote_name('key')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {table} ({key_column}, version)
+                VALUES {', '.join(['(%s, 1)'] * len(keys))}
+                ON CONFLICT ({key_column})
+                DO UPDATE SET version = {table}.version + 1
+                ''',
+                keys
+            )
+
+
+class RecipeChange(models.Model):
+    """
+    Журнал изменённых рецептов.
+
+    По нему индексы процессов догоняют данные, перечитывая только
+    изменённые рецепты. Хранятся последние RECIPE_INDEX_MAX_CHANGES
+    записей: процесс, отставший сильнее, всё равно строит индекс заново.
+    """
+
+    recipe_id = models.PositiveBigIntegerField(
+        verbose_name='Рецепт',
+    )
+
+    class Meta:
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Изменения рецептов'
+
+    def __str__(self):
+        return f'{self.id} {self.recipe_id}'
+
+    @classmethod
+    def log(cls, recipe_ids):
+        """
+        Поднимает версию рецептов и записывает изменённые рецепты.
+
+        Версия поднимается первой: до конца транзакции строка версии
+        заблокирована, и записи журнала получают номера в порядке
+        фиксации транзакций.
+        """
+        recipe_ids = set(recipe_ids)
+        if not recipe_ids:
+            return
+        DataVersion.bump(RECIPES_VERSION_KEY)
+        cls.objects.bulk_create(
+            [cls(recipe_id=recipe_id) for recipe_id in recipe_ids]
+        )
+        old_changes = cls.objects.filter(id__lte=models.Subquery(
+            cls.objects.order_by('-id').values('id')[:1]
+        ) - RECIPE_INDEX_MAX_CHANGES)
+        old_changes._raw_delete(old_changes.db)
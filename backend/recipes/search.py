@@ -0,0 +1,214 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from config import RECIPE_SEARCH_CONFIG, RECIPE_SEARCH_FTS_WEIGHTS
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+
+RECIPE_TABLE = connection.ops.quote_name(Recipe._meta.db_table)
+INGREDIENT_TABLE = connection.ops.quote_name(Ingredient._meta.db_table)
+INGREDIENT_RECIPE_TABLE = connection.ops.quote_name(
+    IngredientRecipe._meta.db_table
+)
+SEARCH_TABLE = connection.ops.quote_name(f'{Recipe._meta.db_table}_search')
+
+WORD_PATTERN = re.compile(r'\w+')
+VOWELS = 'аеиоуыэюя'
+# Окончания прилагательных и существительных, от длинных к коротким.
+# Глагольные окончания не отрезаются: в рецептах они чаще совпадают
+# с концом основы (лимон, омлет), чем меняют смысл запроса.
+RUSSIAN_ENDINGS = sorted(
+    {
+        'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое',
+        'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую',
+        'юю', 'ая', 'яя', 'ою', 'ею',
+        'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'иям', 'ям', 'ам', 'ием',
+        'ев', 'ов', 'ия', 'ья', 'ию', 'ью', 'ье', 'еи', 'ии', 'ь', 'а',
+        'е', 'и', 'й', 'о', 'у', 'ы', 'ю', 'я',
+    },
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 2
+
+
+def stem(word):
+    """
+    Упрощённый стеммер для русского: отрезает самое длинное окончание.
+
+    Окончание ищется только после первой гласной, а от слова остаётся
+    не меньше MIN_STEM_LENGTH букв. Прочие слова не меняются.
+    """
+    word = word.lower().replace('ё', 'е')
+    start = next(
+        (index + 1 for index, letter in enumerate(word) if letter in VOWELS),
+        None
+    )
+    if start is None:
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= max(start, MIN_STEM_LENGTH)):
+            return word[:-len(ending)]
+    return word
+
+
+def get_stems(text):
+    return [stem(word) for word in WORD_PATTERN.findall(text or '')]
+
+
+def update_search_index(recipe_ids=None):
+    """
+    Пересчитывает поисковый документ рецептов (или всех рецептов).
+
+    Документ - название, названия ингредиентов и описание с весами
+    по убыванию. Вызывается после записи рецепта и его ингредиентов,
+    в той же транзакции.
+    """
+    if recipe_ids is not None and not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        update_postgresql_index(recipe_ids)
+    else:
+        update_sqlite_index(recipe_ids)
+
+
+def get_ids_condition(column, recipe_ids):
+    if recipe_ids is None:
+        return '1 = 1', []
+    return (
+        '{} IN ({})'.format(column, ', '.join(['%s'] * len(recipe_ids))),
+        list(recipe_ids)
+    )
+
+
+def update_postgresql_index(recipe_ids):
+    condition, params = get_ids_condition('recipe.id', recipe_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            UPDATE {RECIPE_TABLE} AS recipe
+            SET search_vector =
+                setweight(to_tsvector(%s::regconfig, recipe.name), 'A')
+                || setweight(to_tsvector(%s::regconfig, COALESCE((
+                    SELECT string_agg(ingredient.name, ' ')
+                    FROM {INGREDIENT_RECIPE_TABLE} AS ingredient_recipe
+                    INNER JOIN {INGREDIENT_TABLE} AS ingredient
+                        ON ingredient.id = ingredient_recipe.ingredient_id
+                    WHERE ingredient_recipe.recipe_id = recipe.id
+                ), '')), 'B')
+                || setweight(to_tsvector(%s::regconfig, recipe.text), 'C')
+            WHERE {condition}
+            ''',
+            [RECIPE_SEARCH_CONFIG] * 3 + params
+        )
+
+
+def update_sqlite_index(recipe_ids):
+    condition, params = get_ids_condition(
+        'ingredient_recipe.recipe_id',
+        recipe_ids
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT ingredient_recipe.recipe_id, ingredient.name
+            FROM {INGREDIENT_RECIPE_TABLE} AS ingredient_recipe
+            INNER JOIN {INGREDIENT_TABLE} AS ingredient
+                ON ingredient.id = ingredient_recipe.ingredient_id
+            WHERE {condition}
+            ''',
+            params
+        )
+        ingredients = {}
+        for recipe_id, name in cursor.fetchall():
+            ingredients.setdefault(recipe_id, []).extend(get_stems(name))
+        condition, params = get_ids_condition('id', recipe_ids)
+        cursor.execute(
+            f'SELECT id, name, text FROM {RECIPE_TABLE} WHERE {condition}',
+            params
+        )
+        documents = [
+            (
+                recipe_id,
+                ' '.join(get_stems(name)),
+                ' '.join(ingredients.get(recipe_id, ())),
+                ' '.join(get_stems(text)),
+            )
+            for recipe_id, name, text in cursor.fetchall()
+        ]
+        condition, params = get_ids_condition('rowid', recipe_ids)
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {condition}', params)
+        cursor.executemany(
+            f'''
+            INSERT INTO {SEARCH_TABLE} (rowid, name, ingredients, text)
+            VALUES (%s, %s, %s, %s)
+            ''',
+            documents
+        )
+
+
+def delete_from_search_index(recipe_ids):
+    """
+    Удаляет документы удалённых рецептов.
+
+    Нужно только в SQLite: в PostgreSQL документ - столбец самого
+    рецепта и удаляется вместе с ним.
+    """
+    if connection.vendor == 'postgresql' or not recipe_ids:
+        return
+    condition, params = get_ids_condition('rowid', recipe_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {condition}', params)
+
+
+def search_recipes(queryset, text):
+    """
+    Оставляет рецепты, подходящие под запрос, лучшие - первыми.
+
+    В PostgreSQL запрос разбирает websearch_to_tsquery и условие идёт
+    по GIN-индексу, в SQLite слова запроса приводятся к основам тем же
+    стеммером, что и документы, и ищутся в таблице FTS5.
+    """
+    if connection.vendor == 'postgresql':
+        query = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = [RECIPE_SEARCH_CONFIG, text]
+        return queryset.filter(RawSQL(
+            f'{RECIPE_TABLE}.search_vector @@ {query}',
+            params,
+            output_field=BooleanField()
+        )).order_by(
+            RawSQL(
+                f'ts_rank({RECIPE_TABLE}.search_vector, {query})',
+                params,
+                output_field=FloatField()
+            ).desc(),
+            '-pub_date',
+            '-id',
+        )
+    stems = get_stems(text)
+    if not stems:
+        return queryset.none()
+    match = ' '.join(f'"{word}"' for word in stems)
+    weights = ', '.join(str(weight) for weight in RECIPE_SEARCH_FTS_WEIGHTS)
+    return queryset.filter(RawSQL(
+        f'''{RECIPE_TABLE}.id IN (
+            SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s
+        )''',
+        [match],
+        output_field=BooleanField()
+    )).order_by(
+        RawSQL(
+            f'''(
+                SELECT bm25({SEARCH_TABLE}, {weights}) FROM {SEARCH_TABLE}
+                WHERE {SEARCH_TABLE} MATCH %s
+                    AND rowid = {RECIPE_TABLE}.id
+            )''',
+            [match],
+            output_field=FloatField()
+        ).asc(),
+        '-pub_date',
+        '-id',
+    )
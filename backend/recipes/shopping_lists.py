@@ -0,0 +1,237 @@
+from django.db import connection
+from django.db.models import Sum
+
+from config import SHOPPING_CART_VERSION_KEY, SHOPPING_LIST_BATCH_SIZE
+from recipes.models import (DataVersion, IngredientRecipe, ShoppingCart,
+                            ShoppingListItem)
+
+ITEMS_TABLE = connection.ops.quote_name(ShoppingListItem._meta.db_table)
+INGREDIENT_RECIPE_TABLE = connection.ops.quote_name(
+    IngredientRecipe._meta.db_table
+)
+SHOPPING_CART_TABLE = connection.ops.quote_name(ShoppingCart._meta.db_table)
+
+CART_INGREDIENTS_SQL = f'''
+    FROM {INGREDIENT_RECIPE_TABLE} AS ingredient_recipe
+    INNER JOIN {SHOPPING_CART_TABLE} AS cart
+        ON cart.recipe_id = ingredient_recipe.recipe_id
+'''
+
+
+def get_conditions(recipe_ids, user_id):
+    conditions = [
+        'ingredient_recipe.recipe_id IN ({})'.format(
+            ', '.join(['%s'] * len(recipe_ids))
+        )
+    ]
+    params = list(recipe_ids)
+    if user_id is not None:
+        conditions.append('cart.user_id = %s')
+        params.append(user_id)
+    return ' AND '.join(conditions), params
+
+
+def add_recipes_to_shopping_lists(recipe_ids, user_id=None):
+    """
+    Прибавляет ингредиенты рецептов к спискам покупок.
+
+    Вызывается после того, как рецепты попали в корзину (или их
+    ингредиенты записаны), в той же транзакции.
+    """
+    if not recipe_ids:
+        return
+    conditions, params = get_conditions(recipe_ids, user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {ITEMS_TABLE} (user_id, ingredient_id, total_amount)
+            SELECT cart.user_id, ingredient_recipe.ingredient_id,
+                SUM(ingredient_recipe.amount)
+            {CART_INGREDIENTS_SQL}
+            WHERE {conditions}
+            GROUP BY cart.user_id, ingredient_recipe.ingredient_id
+            ON CONFLICT (user_id, ingredient_id) DO UPDATE
+            SET total_amount = {ITEMS_TABLE}.total_amount
+                + EXCLUDED.total_amount
+            ''',
+            params
+        )
+
+
+def remove_recipes_from_shopping_lists(recipe_ids, user_id=None):
+    """
+    Вычитает ингредиенты рецептов из списков покупок.
+
+    Вызывается до удаления рецептов из корзины (или до изменения их
+    ингредиентов), в той же транзакции.
+    """
+    if not recipe_ids:
+        return
+    conditions, params = get_conditions(recipe_ids, user_id)
+    matching_sql = f'''
+        {CART_INGREDIENTS_SQL}
+        WHERE {conditions}
+            AND cart.user_id = {ITEMS_TABLE}.user_id
+            AND ingredient_recipe.ingredient_id = {ITEMS_TABLE}.ingredient_id
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            UPDATE {ITEMS_TABLE}
+            SET total_amount = total_amount - (
+                SELECT SUM(ingredient_recipe.amount) {matching_sql}
+            )
+            WHERE EXISTS (SELECT 1 {matching_sql})
+            ''',
+            params + params
+        )
+    items = ShoppingListItem.objects.filter(total_amount__lte=0)
+    if user_id is not None:
+        items = items.filter(user_id=user_id)
+    else:
+        items = items.filter(user__shoppingcarts__recipe__in=recipe_ids)
+    items.delete()
+
+
+def subtract_recipes_from_shopping_list(recipe_ids, user_id):
+    """
+    Вычитает ингредиенты рецептов из списка покупок пользователя.
+
+    В отличие от remove_recipes_from_shopping_lists не смотрит
+    в корзину, поэтому вызывается после удаления рецептов из корзины,
+    в той же транзакции.
+    """
+    if not recipe_ids:
+        return
+    recipe_ids_sql = ', '.join(['%s'] * len(recipe_ids))
+    recipe_ingredients_sql = f'''
+        FROM {INGREDIENT_RECIPE_TABLE} AS ingredient_recipe
+        WHERE ingredient_recipe.recipe_id IN ({recipe_ids_sql})
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            UPDATE {ITEMS_TABLE}
+            SET total_amount = total_amount - (
+                SELECT SUM(ingredient_recipe.amount) {recipe_ingredients_sql}
+                AND ingredient_recipe.ingredient_id
+                    = {ITEMS_TABLE}.ingredient_id
+            )
+            WHERE user_id = %s AND ingredient_id IN (
+                SELECT ingredient_recipe.ingredient_id {recipe_ingredients_sql}
+            )
+            ''',
+            [*recipe_ids, user_id, *recipe_ids]
+        )
+    ShoppingListItem.objects.filter(
+        user_id=user_id,
+        total_amount__lte=0,
+    ).delete()
+
+
+def apply_ingredient_deltas(recipe_id, deltas):
+    """
+    Меняет списки покупок на разницу в ингредиентах рецепта.
+
+    deltas - {ingredient_id: изменение количества} для всех корзин,
+    в которых лежит рецепт. Вызывается при изменении ингредиентов
+    рецепта, в той же транзакции.
+    """
+    if not deltas:
+        return
+    deltas_sql = ' UNION ALL '.join(
+        ['SELECT %s AS ingredient_id, %s AS amount'] * len(deltas)
+    )
+    params = [value for delta in deltas.items() for value in delta]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {ITEMS_TABLE} (user_id, ingredient_id, total_amount)
+            SELECT cart.user_id, deltas.ingredient_id, deltas.amount
+            FROM {SHOPPING_CART_TABLE} AS cart
+            CROSS JOIN ({deltas_sql}) AS deltas
+            WHERE cart.recipe_id = %s
+            ON CONFLICT (user_id, ingredient_id) DO UPDATE
+            SET total_amount = {ITEMS_TABLE}.total_amount
+                + EXCLUDED.total_amount
+            ''',
+            params + [recipe_id]
+        )
+    ShoppingListItem.objects.filter(
+        total_amount__lte=0,
+        user__shoppingcarts__recipe=recipe_id,
+    ).delete()
+
+
+def get_live_totals(user_ids=None):
+    """Считает списки покупок агрегатом по корзинам."""
+    carts = ShoppingCart.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user__in=user_ids)
+    return {
+        (item['user'], item['recipe__ingredientsrecipes__ingredient']):
+            item['total_amount']
+        for item in carts.values(
+            'user',
+            'recipe__ingredientsrecipes__ingredient'
+        ).annotate(
+            total_amount=Sum('recipe__ingredientsrecipes__amount')
+        ).order_by().iterator()
+        if item['recipe__ingredientsrecipes__ingredient'] is not None
+    }
+
+
+def find_drifted_users():
+    """Возвращает id пользователей, чьи списки разошлись с корзинами."""
+    live = get_live_totals()
+    stored = {
+        (user_id, ingredient_id): total_amount
+        for user_id, ingredient_id, total_amount
+        in ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount'
+        ).iterator()
+    }
+    return sorted({
+        user_id
+        for user_id, ingredient_id in live.keys() ^ stored.keys()
+    } | {
+        user_id
+        for (user_id, ingredient_id), total_amount in live.items()
+        if stored.get((user_id, ingredient_id), total_amount) != total_amount
+    })
+
+
+def rebuild_shopping_lists(user_ids=None):
+    """
+    Пересобирает списки покупок с нуля.
+
+    Версии корзин затронутых пользователей поднимаются, иначе
+    закэшированный файл списка покупок продолжит отдавать старые суммы.
+    """
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    changed_user_ids = set(
+        items.values_list('user_id', flat=True).distinct()
+    )
+    items.delete()
+    live_totals = get_live_totals(user_ids)
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total_amount,
+            )
+            for (user_id, ingredient_id), total_amount
+            in live_totals.items()
+        ],
+        batch_size=SHOPPING_LIST_BATCH_SIZE,
+    )
+    changed_user_ids.update(user_id for user_id, _ in live_totals)
+    keys = [
+        SHOPPING_CART_VERSION_KEY.format(user_id)
+        for user_id in sorted(changed_user_ids)
+    ]
+    for start in range(0, len(keys), SHOPPING_LIST_BATCH_SIZE):
+        DataVersion.bump(*keys[start:start + SHOPPING_LIST_BATCH_SIZE])
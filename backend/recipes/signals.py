@@ -0,0 +1,134 @@
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from config import (FAVORITES_VERSION_KEY, INGREDIENTS_VERSION_KEY,
+                    SHOPPING_CART_VERSION_KEY, TAGS_VERSION_KEY,
+                    USER_REPRESENTATION_FIELDS)
+from recipes.models import (DataVersion, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, RecipeChange,
+                            ShoppingCart, Tag, User)
+from recipes.search import delete_from_search_index, update_search_index
+
+
+def bump_recipes_cache_version(**filters):
+    """Сбрасывает кэш представлений рецептов, подходящих под фильтр."""
+    Recipe.objects.filter(**filters).update(
+        cache_version=F('cache_version') + 1
+    )
+
+
+def bump_shopping_carts_version(**recipe_filters):
+    """Меняет версию корзин, в которых лежат подходящие рецепты."""
+    user_ids = ShoppingCart.objects.filter(
+        recipe__in=Recipe.objects.filter(**recipe_filters)
+    ).values_list('user_id', flat=True).distinct()
+    keys = [SHOPPING_CART_VERSION_KEY.format(user_id) for user_id in user_ids]
+    if keys:
+        DataVersion.bump(*keys)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_pre_save(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance.cache_version += 1
+        return
+    # Версию поднимает база: ту же колонку через F() меняют воркер
+    # картинок и сигналы связей, и значение из памяти затёрло бы их.
+    instance.cache_version = F('cache_version') + 1
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    if not created:
+        instance.refresh_from_db(fields=('cache_version',))
+        bump_shopping_carts_version(pk=instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipes_table_changed(sender, instance, **kwargs):
+    RecipeChange.log([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    delete_from_search_index([instance.pk])
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    DataVersion.bump(SHOPPING_CART_VERSION_KEY.format(instance.user_id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    DataVersion.bump(FAVORITES_VERSION_KEY.format(instance.user_id))
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_recipe_changed(sender, instance, **kwargs):
+    bump_recipes_cache_version(pk=instance.recipe_id)
+    RecipeChange.log([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # После очистки уже не узнать, у каких рецептов был тег.
+        instance._cleared_recipe_ids = list(
+            instance.recipes.values_list('id', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif pk_set:
+        recipe_ids = list(pk_set)
+    else:
+        recipe_ids = instance.__dict__.pop('_cleared_recipe_ids', [])
+    bump_recipes_cache_version(pk__in=recipe_ids)
+    RecipeChange.log(recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+def tag_changed(sender, instance, created, **kwargs):
+    if not created:
+        bump_recipes_cache_version(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        bump_recipes_cache_version(ingredients=instance)
+        bump_shopping_carts_version(ingredients=instance)
+        update_search_index(list(Recipe.objects.filter(
+            ingredients=instance
+        ).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_table_changed(sender, **kwargs):
+    DataVersion.bump(INGREDIENTS_VERSION_KEY)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_table_changed(sender, **kwargs):
+    DataVersion.bump(TAGS_VERSION_KEY)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    if (update_fields is not None
+            and not set(update_fields) & set(USER_REPRESENTATION_FIELDS)):
+        return
+    bump_recipes_cache_version(author=instance)
@@ -0,0 +1,98 @@
+from django.db import connection
+
+
+def add_link(model, **values):
+    """
+    Добавляет связь одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает True, если строка добавлена, и False, если такая связь
+    уже была. Сигналы post_save не отправляются.
+    """
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(
+        quote_name(model._meta.get_field(name).column) for name in values
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {quote_name(model._meta.db_table)} ({columns})
+            VALUES ({', '.join(['%s'] * len(values))})
+            ON CONFLICT DO NOTHING
+            ''',
+            list(values.values())
+        )
+        return cursor.rowcount == 1
+
+
+def remove_link(model, **filters):
+    """
+    Удаляет связь одним DELETE.
+
+    Возвращает True, если строка была. Сигналы post_delete
+    не отправляются.
+    """
+    queryset = model.objects.filter(**filters)
+    return queryset._raw_delete(queryset.db) > 0
+
+
+def get_ids_sql(ids):
+    return '({})'.format(', '.join(['%s'] * len(ids)))
+
+
+def add_links(model, field, ids, **values):
+    """
+    Добавляет связи с объектами ids одним INSERT ... SELECT.
+
+    values - общие для всех строк поля, например user_id. Несуществующие
+    объекты и уже добавленные связи пропускаются тем же запросом.
+    Возвращает множество id, для которых строка добавлена.
+    """
+    if not ids:
+        return set()
+    quote_name = connection.ops.quote_name
+    target = model._meta.get_field(field)
+    related_meta = target.related_model._meta
+    related_pk = quote_name(related_meta.pk.column)
+    columns = ', '.join(
+        quote_name(model._meta.get_field(name).column)
+        for name in (*values, target.attname)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {quote_name(model._meta.db_table)} ({columns})
+            SELECT {'%s, ' * len(values)}{related_pk}
+            FROM {quote_name(related_meta.db_table)}
+            WHERE {related_pk} IN {get_ids_sql(ids)}
+            ON CONFLICT DO NOTHING
+            RETURNING {quote_name(target.column)}
+            ''',
+            [*values.values(), *ids]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def remove_links(model, field, ids, **values):
+    """
+    Удаляет связи с объектами ids одним DELETE ... RETURNING.
+
+    Возвращает множество id, для которых строка была.
+    """
+    if not ids:
+        return set()
+    quote_name = connection.ops.quote_name
+    target = quote_name(model._meta.get_field(field).column)
+    conditions = ''.join(
+        f'{quote_name(model._meta.get_field(name).column)} = %s AND '
+        for name in values
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            DELETE FROM {quote_name(model._meta.db_table)}
+            WHERE {conditions}{target} IN {get_ids_sql(ids)}
+            RETURNING {target}
+            ''',
+            [*values.values(), *ids]
+        )
+        return {row[0] for row in cursor.fetchall()}
@@ -0,0 +1,56 @@
+from array import array
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from config import (FAVORITES_VERSION_KEY, SHOPPING_CART_VERSION_KEY,
+                    USER_RECIPE_IDS_CACHE_KEY, USER_RECIPE_IDS_CACHE_TIMEOUT)
+from recipes.models import DataVersion, Favorite, ShoppingCart
+
+UserRecipeIds = namedtuple('UserRecipeIds', ('favorites', 'shopping_cart'))
+USER_RECIPE_MODELS = (
+    (Favorite, FAVORITES_VERSION_KEY),
+    (ShoppingCart, SHOPPING_CART_VERSION_KEY),
+)
+NO_RECIPE_IDS = UserRecipeIds(frozenset(), frozenset())
+# 8 байт на id: первичные ключи bigint и не помещаются в 'I'. Тип массива
+# входит в ключ кэша, чтобы не читать записи в другом формате.
+RECIPE_IDS_TYPECODE = 'Q'
+
+
+def load_user_recipe_ids(user_id):
+    """
+    id рецептов в избранном и корзине пользователя.
+
+    Наборы хранятся в кэше массивами по 8 байт на id под версиями
+    'favorites:{id}' и 'shopping_cart:{id}', поэтому на запрос уходит
+    одно чтение версий и одно чтение кэша.
+    """
+    keys = [key.format(user_id) for _, key in USER_RECIPE_MODELS]
+    versions = dict(
+        DataVersion.objects.filter(key__in=keys).values_list('key', 'version')
+    )
+    cache_keys = [
+        USER_RECIPE_IDS_CACHE_KEY.format(
+            typecode=RECIPE_IDS_TYPECODE,
+            key=key,
+            version=versions.get(key, 0)
+        )
+        for key in keys
+    ]
+    cached = cache.get_many(cache_keys)
+    missing = {}
+    sets = []
+    for (model, _), cache_key in zip(USER_RECIPE_MODELS, cache_keys):
+        ids = array(RECIPE_IDS_TYPECODE)
+        if cache_key in cached:
+            ids.frombytes(cached[cache_key])
+        else:
+            ids.extend(sorted(model.objects.filter(
+                user_id=user_id
+            ).values_list('recipe_id', flat=True)))
+            missing[cache_key] = ids.tobytes()
+        sets.append(frozenset(ids))
+    if missing:
+        cache.set_many(missing, USER_RECIPE_IDS_CACHE_TIMEOUT)
+    return UserRecipeIds(*sets)